@@ -18,28 +18,44 @@ from collections import namedtuple
 
 try:
     import gdb
+except ImportError:
+    # Support importing heap.parser from outside gdb
+    pass
 
+from du.mappings import address_space
 
-    # We defer most type lookups to when they're needed, since they'll fail if the
-    # DWARF data for the relevant DSO hasn't been loaded yet, which is typically
-    # the case for an executable dynamically linked against glibc
 
-    type_void_ptr = gdb.lookup_type('void').pointer()
-    type_char_ptr = gdb.lookup_type('char').pointer()
-    type_unsigned_char_ptr = gdb.lookup_type('unsigned char').pointer()
-    sizeof_ptr = type_void_ptr.sizeof
+# We defer all type lookups to when they're needed, since they'll fail if the
+# DWARF data for the relevant DSO hasn't been loaded yet, which is typically
+# the case for an executable dynamically linked against glibc. Even lookup
+# of basic types may expand symbol tables of all objfiles, which is slow
+# for binaries with huge debug info.
+#
+# Basic pointer types and pointer size are module attributes looked up on first
+# use (du.sizeof_ptr), don't import them by "from du import sizeof_ptr".
+LAZY_TYPES = ('type_void_ptr', 'type_char_ptr', 'type_unsigned_char_ptr', 'sizeof_ptr')
 
-    if sizeof_ptr == 4:
-        def fmt_addr(addr):
-            return '0x%08x' % addr
-    else:
-        # Assume 64-bit:
-        def fmt_addr(addr):
-            return '0x%016x' % addr
 
-except ImportError:
-    # Support importing heap.parser from outside gdb
-    pass
+def __getattr__(name):
+    if name in LAZY_TYPES:
+        return lazy_type(name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def lazy_type(name):
+    value = globals().get(name)
+    if value is None:
+        g = globals()
+        g['type_void_ptr'] = gdb.lookup_type('void').pointer()
+        g['type_char_ptr'] = gdb.lookup_type('char').pointer()
+        g['type_unsigned_char_ptr'] = gdb.lookup_type('unsigned char').pointer()
+        g['sizeof_ptr'] = g['type_void_ptr'].sizeof
+        value = g[name]
+    return value
+
+
+def fmt_addr(addr):
+    return '0x%0*x' % (2 * lazy_type('sizeof_ptr'), addr)
 
 
 class WrongInferiorProcess(RuntimeError):
@@ -50,14 +66,19 @@ NUM_HEXDUMP_BYTES = 20
 
 __type_cache = {}
 
+# hits and misses of caching_lookup_type, reported by "du --stats"
+type_cache_stats = {'hits': 0, 'misses': 0}
+
 def caching_lookup_type(typename):
     '''Adds caching to gdb.lookup_type(), whilst still raising RuntimeError if
     the type isn't found.'''
     if typename in __type_cache:
+        type_cache_stats['hits'] += 1
         gdbtype = __type_cache[typename]
         if gdbtype:
             return gdbtype
         raise RuntimeError('(cached) Could not find type "%s"' % typename)
+    type_cache_stats['misses'] += 1
     try:
         if 0:
             print('type cache miss: %r' % typename)
@@ -76,6 +97,25 @@ def safe_caching_lookup_type(typename):
     except RuntimeError:
         return None
 
+def forget_missing_types(event=None):
+    '''Types not found before may be defined by newly loaded objfile,
+    so cached misses are looked up again'''
+    for typename in [name for name, gdbtype in __type_cache.items() if gdbtype is None]:
+        del __type_cache[typename]
+
+def clear_type_cache(event=None):
+    '''Types of unloaded objfiles are not valid anymore'''
+    __type_cache.clear()
+    for name in LAZY_TYPES:
+        globals().pop(name, None)
+
+try:
+    gdb.events.new_objfile.connect(forget_missing_types)
+    gdb.events.clear_objfiles.connect(clear_type_cache)
+except NameError:
+    # outside gdb
+    pass
+
 def array_length(_gdbval):
     '''Given a gdb.Value that's an array, determine the number of elements in
     the array'''
@@ -93,7 +133,7 @@ def offsetof(typename, fieldname):
     t = caching_lookup_type(typename).pointer()
     v = gdb.Value(0)
     v = v.cast(t)
-    field = v[fieldname].cast(type_void_ptr)
+    field = v[fieldname].cast(lazy_type('type_void_ptr'))
     return int(field.address)
 
 class MissingDebuginfo(RuntimeError):
@@ -157,7 +197,7 @@ class WrappedValue(object):
 
 class WrappedPointer(WrappedValue):
     def as_address(self):
-        return int(self._gdbval.cast(type_void_ptr))
+        return int(self._gdbval.cast(lazy_type('type_void_ptr')))
 
     def __str__(self):
         return ('<%s for inferior 0x%x>'
@@ -262,14 +302,42 @@ class Usage(object):
             self.hd = hexdump_as_bytes(self.start, NUM_HEXDUMP_BYTES)
 
 
-def hexdump_as_bytes(addr, size, chars_only=True):
-    addr = gdb.Value(addr).cast(type_unsigned_char_ptr)
-    bytebuf = []
-    for j in range(size):
-        ptr = addr + j
-        b = int(ptr.dereference())
-        bytebuf.append(b)
-
+def read_memory(addr, size):
+    '''Read memory of the inferior process by single read, as bytes'''
+    return gdb.selected_inferior().read_memory(addr, size).tobytes()
+
+def unpack_words(bytebuf):
+    '''Split bytes to list of pointer sized integers (in native byte order)'''
+    sizeof_ptr = lazy_type('sizeof_ptr')
+    usable = len(bytebuf) - len(bytebuf) % sizeof_ptr
+    return memoryview(bytebuf)[:usable].cast('Q' if sizeof_ptr == 8 else 'I').tolist()
+
+def iter_memory_regions(addresses, length, gap=4096, limit=1024 * 1024):
+    '''Read "length" bytes at every address, nearby addresses are read
+    together by single read. Yields (region addresses, region start, bytes),
+    bytes are None when the address is not readable.'''
+    inferior = gdb.selected_inferior()
+    addresses = sorted(addresses)
+    i = 0
+    while i < len(addresses):
+        j = i + 1
+        while (j < len(addresses)
+               and addresses[j] - addresses[j - 1] <= gap
+               and addresses[j] + length - addresses[i] <= limit):
+            j += 1
+        start = addresses[i]
+        try:
+            yield addresses[i:j], start, inferior.read_memory(start, addresses[j - 1] + length - start).tobytes()
+        except gdb.MemoryError:
+            # some address in the region is not readable, try them one by one
+            for address in addresses[i:j]:
+                try:
+                    yield [address], address, inferior.read_memory(address, length).tobytes()
+                except gdb.MemoryError:
+                    yield [address], address, None
+        i = j
+
+def format_hexdump_bytes(bytebuf, chars_only=True):
     result = ''
     if not chars_only:
         result += ' '.join(['%02x' % b for b in bytebuf]) + ' |'
@@ -278,18 +346,12 @@ def hexdump_as_bytes(addr, size, chars_only=True):
 
     return (result)
 
+def hexdump_as_bytes(addr, size, chars_only=True):
+    return format_hexdump_bytes(read_memory(addr, size), chars_only)
+
 def hexdump_as_int(addr, count):
-    addr = gdb.Value(addr).cast(caching_lookup_type('unsigned long').pointer())
-    bytebuf = []
-    longbuf = []
-    for j in range(count):
-        ptr = addr + j
-        long = ptr.dereference()
-        longbuf.append(long)
-        bptr = gdb.Value(ptr).cast(type_unsigned_char_ptr)
-        for i in range(sizeof_ptr):
-            bytebuf.append(int((bptr + i).dereference()))
-    return (' '.join([fmt_addr(int) for long in longbuf])
+    bytebuf = read_memory(addr, count * lazy_type('sizeof_ptr'))
+    return (' '.join([fmt_addr(long) for long in unpack_words(bytebuf)])
             + ' |'
             + ''.join([as_hexdump_char(b) for b in bytebuf])
             + '|')
@@ -593,7 +655,7 @@ def categorize(u, usage_set):
 
 def as_nul_terminated_string(addr, size):
     # Does this look like a NUL-terminated string?
-    ptr = gdb.Value(addr).cast(type_char_ptr)
+    ptr = gdb.Value(addr).cast(lazy_type('type_char_ptr'))
     try:
         s = ptr.string(encoding='ascii')
         return s
@@ -692,21 +754,47 @@ def iter_usage():
 
 
 
-def looks_like_ptr(value):
+def type_alignment(type):
+    '''alignment of the type, 1 when it is not known (gdb < 8.2)'''
+    try:
+        return getattr(type, 'alignof', 1) or 1
+    except gdb.error:
+        return 1
+
+
+def looks_like_ptr(value, size=1, alignment=1):
     '''Does this gdb.Value pointer's value looks reasonable?
 
     For use when casting a block of memory to a structure on pointer fields
-    within that block of memory.
+    within that block of memory. Pointed memory (size bytes) has to be mapped
+    readable and the address aligned, it is checked before any read.
     '''
 
     # NULL is acceptable; assume that it's 0 on every arch we care about
     if value == 0:
         return True
 
-    # Assume that pointers aren't allocated in the bottom 1MB of a process'
-    # address space:
-    if value < (1024 * 1024):
+    addr = int(value)
+    if addr % alignment:
+        return False
+
+    # mappings are loaded once per stop
+    space = address_space()
+    if space.mappings:
+        return space.is_readable(addr, max(1, size))
+
+    # Mappings are not known, assume that pointers aren't allocated
+    # in the bottom 1MB of a process' address space:
+    if addr < (1024 * 1024):
         return False
 
     # Assume that if it got this far, that it's valid:
     return True
+
+
+def measure(value, **opts):
+    '''Measure memory used by gdb.Value, returns du.result.DuResult
+    with the size and tree of traversed values, see du.commands.measure'''
+    # du.commands imports this module
+    from du.commands import measure
+    return measure(value, **opts)
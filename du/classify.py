@@ -0,0 +1,158 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Classification of heap chunks by prefixes of their memory, in one pass
+over the heap:
+
+  - the first word pointing to a vtable: C++ class (polymorphic)
+  - mostly printable bytes: string data
+  - anything else is uncategorized
+
+Chunks are classified in batches, first words of the whole batch are
+decoded by single unpack and mapping and vtable lookups are done once
+per distinct word.
+"""
+
+import re
+from collections import defaultdict
+from itertools import islice
+
+import du
+from du import Category, unpack_words
+from du.mappings import address_space
+from du.hexdump import symbol_for_address, MIN_STRING_LENGTH
+
+try:
+    import gdb
+except ImportError:
+    pass
+
+# bytes of chunk memory used for classification
+PREFIX_SIZE = 64
+# chunks classified at once
+BATCH_SIZE = 4096
+# minimal ratio of printable bytes (up to NUL) of string data
+STRING_RATIO = 0.9
+
+CATEGORY_STRING = Category('C', 'string data')
+CATEGORY_UNCATEGORIZED = Category('uncategorized', '')
+CATEGORY_FREE = Category('free', '')
+
+_PRINTABLE = bytes(range(0x20, 0x7f)) + b'\t\n\r'
+_VTABLE = re.compile(r'^vtable for (.+?)(?: \+ \d+)? in section ')
+
+__vtable_cache = {}
+
+
+def vtable_class(addr, mapping):
+    '''Name of the class when the address points into its vtable, or None.
+    Results are cached per address, objects of the class share it.'''
+    try:
+        return __vtable_cache[addr]
+    except KeyError:
+        pass
+    m = _VTABLE.match(symbol_for_address(addr, mapping) or '')
+    name = m.group(1) if m is not None else None
+    __vtable_cache[addr] = name
+    return name
+
+
+def invalidate_vtables(event=None):
+    __vtable_cache.clear()
+
+
+def looks_like_string(prefix):
+    '''Printable bytes up to the first NUL (or the end of the prefix)'''
+    head = prefix.split(b'\0', 1)[0]
+    if len(head) < MIN_STRING_LENGTH:
+        return False
+    unprintable = len(head.translate(None, _PRINTABLE))
+    return unprintable <= len(head) * (1 - STRING_RATIO)
+
+
+def classify_batch(prefixes, space, categories):
+    '''Categories of chunks with given memory prefixes'''
+    ptr_size = du.sizeof_ptr
+    words = unpack_words(b''.join(p[:ptr_size].ljust(ptr_size, b'\0') for p in prefixes))
+    classes = {}
+    for word in set(words):
+        if word % ptr_size:
+            continue
+        mapping = space.find(word)
+        # vtables are in read-only data (.data.rel.ro is read-only after relocation)
+        if mapping is None or not mapping.readable or mapping.writable or mapping.is_heap:
+            continue
+        name = vtable_class(word, mapping)
+        if name is not None:
+            category = categories.get(name)
+            if category is None:
+                category = categories[name] = Category('C++', 'class', name)
+            classes[word] = category
+
+    result = []
+    for word, prefix in zip(words, prefixes):
+        category = classes.get(word)
+        if category is None:
+            category = CATEGORY_STRING if looks_like_string(prefix) else CATEGORY_UNCATEGORIZED
+        result.append(category)
+    return result
+
+
+def classify_chunks(chunks):
+    '''Yield (chunk, category) for (chunk, prefix) pairs of the heap walker'''
+    space = address_space()
+    categories = {}
+    chunks = iter(chunks)
+    while True:
+        batch = list(islice(chunks, BATCH_SIZE))
+        if not batch:
+            return
+        classified = iter(classify_batch([prefix for chunk, prefix in batch if chunk.inuse],
+                                         space, categories))
+        for chunk, prefix in batch:
+            yield chunk, next(classified) if chunk.inuse else CATEGORY_FREE
+
+
+class CategorySummary(object):
+    '''Number of chunks and bytes per category'''
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.sizes = defaultdict(int)
+
+    def add(self, category, size):
+        self.counts[category] += 1
+        self.sizes[category] += size
+
+    def categories(self):
+        '''categories sorted by size, the biggest first'''
+        return sorted(self.sizes, key=self.sizes.get, reverse=True)
+
+    @property
+    def count(self):
+        return sum(self.counts.values())
+
+    @property
+    def size(self):
+        return sum(self.sizes.values())
+
+
+try:
+    gdb.events.new_objfile.connect(invalidate_vtables)
+    gdb.events.clear_objfiles.connect(invalidate_vtables)
+except NameError:
+    # outside gdb
+    pass
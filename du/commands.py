@@ -18,18 +18,126 @@
 import gdb
 import re
 import sys
+import math
+import time
+import random
+import struct
 import argparse
+import statistics
 from . import caching_lookup_type, safe_caching_lookup_type
 
 class DuArgs:
     def __init__(self):
-        self.print_level_limit = 3
         self.level_limit = 30
+        # values not followed because of level_limit
+        self.depth_limited = 0
         self.follow_static = False
+        # follow at most this number of random elements per array (0 = all)
+        self.sample = 0
+        self.random = random.Random()
+        # some array was sampled, size is an estimate
+        self.sampled = False
+        # accumulated variance of the sampled estimates
+        self.sample_variance = 0.0
+        # time.monotonic() value when traversal should stop, or None
+        self.deadline = None
+        self.progress_interval = 1.0
+        # traversal statistics, for progress reporting and "du --stats"
+        self.nodes = 0
+        self.bytes_read = 0
+        self.derefs = 0
+        self.fetches = 0
+        self.visits = 0
+        self.visited_hits = 0
+        # pointers rejected by address space map (not mapped or misaligned)
+        self.invalid_ptrs = 0
+        # DuStats instance when handler timing is enabled
+        self.stats = None
+        # Qt implicitly shared data blocks, charged once
+        self.qt_shared_blocks = 0
+        self.qt_shared_bytes = 0
+        self.qt_unique_blocks = 0
+        self.qt_unique_bytes = 0
+        # PathFilter when "du --path" is used, state of the current node
+        # and bytes of matched subtrees
+        self.path = None
+        self.path_state = None
+        self.path_bytes = 0
+        # Ownership when multiple expressions are sized together
+        self.ownership = None
+        # FoldedStacks for "du --folded"
+        self.folded = None
+        # ResultTree built by du.measure
+        self.result = None
+        # follow elements of arrays in bulk by du_follow_strided, when possible
+        self.strided = True
+        self.start_time = time.monotonic()
+        self.last_progress = self.start_time
+
+
+class DuInterrupted(Exception):
+    """ raised when traversal is stopped before it is complete (timeout or Ctrl-C),
+    it collects partial size and number of pending nodes while the stack is unwinding.
+    """
+    def __init__(self, reason):
+        super(DuInterrupted, self).__init__(reason)
+        self.reason = reason
+        self.partial = 0
+        self.pending = 0
+
+
+def interrupted(e, size, pending=0):
+    """ convert KeyboardInterrupt to DuInterrupted and add partial size
+    and pending nodes of the current stack frame
+    """
+    if not isinstance(e, DuInterrupted):
+        e = DuInterrupted('interrupted')
+    e.partial += int(size)
+    e.pending += pending
+    return e
 
 
-from du import fmt_size, fmt_addr, \
-    hexdump_as_bytes
+# how often (in visited nodes) is checked deadline and progress, must be 2^n - 1
+CHECK_MASK = 0x3ff
+
+
+def check_progress(du_args):
+    """ called for every visited node, stop traversal when deadline is reached
+    and print progress to stderr periodically
+    """
+    du_args.nodes += 1
+    if du_args.nodes & CHECK_MASK:
+        return
+    report_progress(du_args)
+
+
+def report_progress(du_args):
+    """ stop traversal when deadline is reached and print progress, if it is time to """
+    now = time.monotonic()
+    if du_args.deadline is not None and now >= du_args.deadline:
+        raise DuInterrupted('timeout')
+    if du_args.progress_interval is not None and now - du_args.last_progress >= du_args.progress_interval:
+        du_args.last_progress = now
+        elapsed = now - du_args.start_time
+        sys.stderr.write('du: %s nodes visited (%d nodes/s), %s bytes read\n'
+                         % (fmt_size(du_args.nodes), du_args.nodes / elapsed, fmt_size(du_args.bytes_read)))
+
+
+import du
+from du import Table, fmt_size, fmt_addr, \
+    read_memory, iter_memory_regions, looks_like_ptr, type_alignment
+from du.roots import global_symbols, symbol_value, \
+    iter_frames, iter_frame_locals, frame_function_name
+from du.hexdump import iter_hexdump_lines, iter_hexdump_byte_lines
+from du.stats import DuStats
+from du.registry import handlers, register_handler, template_regex
+from du.path import PathFilter, parse_path
+from du.ownership import Ownership
+from du.folded import FoldedStacks, NO_FRAME
+from du.result import ResultTree, DuResult
+from du.mappings import address_space
+from du.heap import iter_heap_chunks_with_prefix
+from du.classify import classify_chunks, CategorySummary, PREFIX_SIZE
 
 
 def is_container_type(type):
@@ -47,6 +155,16 @@ def is_pointer(v):
     return (v.type.strip_typedefs().code == gdb.TYPE_CODE_PTR)
 
 
+def is_owning_array(type, du_args):
+    """ fixed size array with elements which may own some memory """
+    if type.code == gdb.TYPE_CODE_TYPEDEF:
+        type = type.strip_typedefs()
+    if type.code != gdb.TYPE_CODE_ARRAY:
+        return False
+    layout = element_layout(type.target())
+    return bool(layout.entries) or (layout.has_static and du_args.follow_static)
+
+
 def get_typedef(type, type_name):
     """ return possible typedef of "type" its name starts with type_name.
      it may be used for templated types, where it is not possible to use gdb.lookup_type.
@@ -60,222 +178,1148 @@ def get_typedef(type, type_name):
     return None
 
 
+def visit(address, du_args, visited_ptrs):
+    """ mark address as visited, returns False when it was visited already """
+    du_args.visits += 1
+    if du_args.ownership is not None:
+        if du_args.ownership.visit(address):
+            return True
+    elif address not in visited_ptrs:
+        visited_ptrs.add(address)
+        return True
+    du_args.visited_hits += 1
+    return False
+
+
+def du_call_timed(handler, s, level, du_args, visited_ptrs):
+    """ call container handler, measure its time when "du --stats" is enabled """
+    if du_args.stats is None:
+        return handler(s, level, du_args, visited_ptrs)
+    return du_args.stats.call(handler.__name__, handler, s, level, du_args, visited_ptrs)
+
+
+def du_follow_child(kind, key, v, follow, level, du_args, visited_ptrs, stored=True):
+    """ follow child value of the current node, field (kind 'field', key is its name)
+    or element ('index', key is its index), by follow(v, level, du_args, visited_ptrs).
+    Size of the child (including its sizeof, when it is stored in the node,
+    static members are not) is aggregated by its path for "du --folded"
+    and recorded in the result tree of du.measure.
+    """
+    folded = du_args.folded
+    result = du_args.result
+    if (folded is None and result is None) or kind is None:
+        if du_args.path is None:
+            return follow(v, level, du_args, visited_ptrs)
+        return du_follow_path_child(kind, key, v, follow, level, du_args, visited_ptrs, stored)
+    if folded is not None:
+        parent = folded.current
+        frame = folded.child(parent, kind, key)
+        folded.current = frame
+    if result is not None:
+        node = result.enter(kind, key, v.type, v.address)
+    path = du_args.path
+    # above the match, just matched subtrees are counted
+    matching = path is not None and not path.matched(du_args.path_state)
+    matched = du_args.path_bytes
+    try:
+        if path is None:
+            size = follow(v, level, du_args, visited_ptrs)
+        else:
+            size = du_follow_path_child(kind, key, v, follow, level, du_args, visited_ptrs, stored)
+    finally:
+        if folded is not None:
+            folded.current = parent
+    if matching:
+        child_size = du_args.path_bytes - matched
+    else:
+        child_size = (v.type.sizeof if stored else 0) + int(size)
+    if folded is not None:
+        folded.add_child(parent, frame, child_size)
+    if result is not None:
+        result.leave(node, child_size)
+    return size
+
+
+def du_follow_path_child(kind, key, v, follow, level, du_args, visited_ptrs, stored=True):
+    """ follow child value, children pruned by path filter are not followed,
+    size of subtrees matched by the filter is accumulated in du_args.path_bytes.
+    """
+    path = du_args.path
+    if path is None or kind is None:
+        return follow(v, level, du_args, visited_ptrs)
+    parent = du_args.path_state
+    state = path.step(parent, kind, key)
+    if state is None:
+        return 0
+    if state is parent:
+        return follow(v, level, du_args, visited_ptrs)
+    du_args.path_state = state
+    try:
+        size = follow(v, level, du_args, visited_ptrs)
+    finally:
+        du_args.path_state = parent
+    if path.matched(state) and not path.matched(parent):
+        du_args.path_bytes += (v.type.sizeof if stored else 0) + int(size)
+    return size
+
+
+def du_follow_scalar(v, level, du_args, visited_ptrs):
+    """ scalar value doesn't own any memory """
+    return 0
+
+
+def valid_pointer(address, type, du_args):
+    """ value of the type at address may be read, it is checked against
+    mappings of the inferior before any read is attempted
+    """
+    if looks_like_ptr(address, type.sizeof, type_alignment(type)):
+        return True
+    du_args.invalid_ptrs += 1
+    return False
+
+
 def du_follow_pointer(v, level, du_args, visited_ptrs):
-    indent = ' ' * level
+    if du_args.ownership is not None:
+        return du_args.ownership.track(du_follow_pointee, v, level, du_args, visited_ptrs)
+    return du_follow_pointee(v, level, du_args, visited_ptrs)
+
+
+def du_follow_pointee(v, level, du_args, visited_ptrs):
     try:
         v1 = v.dereference()
-        address = str(v1.address)
-        if address == '0x0':
+        du_args.derefs += 1
+        address = int(v1.address)
+        if address == 0:
+            return 0
+        if not valid_pointer(address, v1.type, du_args):
             return 0
-        if address in visited_ptrs:
-            if level < du_args.print_level_limit:
-                gdb.write(' // visited already\n')
+        if not visit(address, du_args, visited_ptrs):
             return 0
-        visited_ptrs.append(address)
+        du_args.fetches += 1
         v1.fetch_lazy()
-    except gdb.error as e:
-        if level < du_args.print_level_limit:
-            gdb.write(', (%s)\n' % e)
+    except gdb.error:
         return 0
 
-    if level < du_args.print_level_limit:
-        gdb.write(' // sizeof: %d\n' % (v1.type.sizeof))
-        gdb.write('%s  -> ' % indent)
     size = v1.type.sizeof
-    size += du_follow(v1, level + 1, du_args, visited_ptrs)
+    du_args.bytes_read += size
+    try:
+        size += du_follow(v1, level + 1, du_args, visited_ptrs)
+    except (DuInterrupted, KeyboardInterrupt) as e:
+        raise interrupted(e, size)
     return size
 
 
 def du_string(s, level, du_args, visited_ptrs):
-    indent = ' ' * level
-
     char_ptr = s['_M_dataplus']['_M_p']
     local_buff_ptr = s['_M_local_buf']
     size=0
     if char_ptr != local_buff_ptr: # see std::string::_M_is_local
         size = s['_M_allocated_capacity']
 
-    if level < du_args.print_level_limit:
-        if size==0:
-            gdb.write('%s %s // stored locally\n' % (s.type, s))
-        else:
-            gdb.write('%s %s // sizeof: %d\n' % (s.type, s, size))
     return size
 
 
-def du_qt_string_data(s, element_type, level, du_args, visited_ptrs):
+def qt_element_type(type):
+    """ element type of QTypedArrayData, char for untyped QArrayData """
+    typed_array_data = get_typedef(type, 'QTypedArrayData')
+    if typed_array_data is None:
+        # not sure about array type, QTypedArrayData should be detected usually...
+        return safe_caching_lookup_type('char')
+    # TODO: handle possible pointers in s.type
+    return typed_array_data.template_argument(0)
+
+
+def qt_ref_count(ref):
+    """ value of QtPrivate::RefCount, -1 for static data, 0 for unsharable """
+    v = ref
+    # RefCount -> QBasicAtomicInt -> std::atomic<int> -> ... -> int,
+    # static members (_S_alignment of std::__atomic_base) are skipped
+    while is_container(v):
+        v = v[next(k for k in v.type.strip_typedefs().fields() if hasattr(k, 'bitpos'))]
+    return int(v)
+
+
+def qt_account_shared(ref_count, size, du_args):
+    """ track memory of implicitly shared data block, it is charged once """
+    if ref_count > 1:
+        du_args.qt_shared_blocks += 1
+        du_args.qt_shared_bytes += size
+    else:
+        du_args.qt_unique_blocks += 1
+        du_args.qt_unique_bytes += size
+
+
+def du_qt_string_data(s, level, du_args, visited_ptrs):
+    element_type = qt_element_type(s.type)
     header_size = s.type.sizeof
     offset = s['offset']
     alloc = s['alloc']
-    array_size = s['size']
+
+    ref_count = qt_ref_count(s['ref'])
+    if ref_count == -1:
+        # static data is not allocated, header size is counted already
+        return -header_size
 
     # header size is counted already...
     size = offset - header_size + alloc * element_type.sizeof
-
-    char_t = safe_caching_lookup_type('char')
-    char_pt = char_t.pointer()
-    arr = (s.address.cast(char_pt) + offset).cast(element_type.pointer())
-
-    if level < du_args.print_level_limit:
-        gdb.write('%s "' % s.type)
-        for i in range(0, array_size):
-            entry = arr[i]
-            if entry >= 0x20 and entry <= 0x7e:
-                gdb.write('%s' % chr(entry))
-            else:
-                gdb.write('" + QChar(%d) + \"' % entry)
-        gdb.write('" // length: %d, allocated extra size: %s\n' % (array_size, size))
+    qt_account_shared(ref_count, header_size + int(size), du_args)
     return size
 
 
-def du_qt_array_data(s, element_type, level, du_args, visited_ptrs):
-    indent = ' ' * level
-    if level < du_args.print_level_limit:
-        gdb.write('%s [' % s.type)
+def du_qt_array_data(s, level, du_args, visited_ptrs):
+    element_type = qt_element_type(s.type)
 
     header_size = s.type.sizeof
     offset = s['offset']
     alloc = s['alloc']
     array_size = s['size']
 
+    ref_count = qt_ref_count(s['ref'])
+    if ref_count == -1:
+        # static data is not allocated, header size is counted already
+        return -header_size
+
     # header size is counted already...
     size = offset - header_size + alloc * element_type.sizeof
+    qt_account_shared(ref_count, header_size + int(size), du_args)
 
     char_pt = safe_caching_lookup_type('char').pointer()
     arr = (s.address.cast(char_pt) + offset).cast(element_type.pointer())
 
-    if level < du_args.print_level_limit:
-        gdb.write(' // %d elements of %s, starts at %s (allocated extra size: %s)\n' % (array_size, element_type, str(arr), size))
+    try:
+        size += du_follow_elements(lambda i: arr[i], int(array_size), level, du_args, visited_ptrs,
+                                   int(arr), element_type)
+    except DuInterrupted as e:
+        raise interrupted(e, size)
+
+    return size
+
+
+def qt_shared_data(d, level, du_args, visited_ptrs):
+    """ check "d" pointer of implicitly shared Qt container,
+    returns its reference count, or None when it should not be charged
+    (null, static or visited already)
+    """
+    address = int(d)
+    if address == 0:
+        return None
+    ref_count = qt_ref_count(d['ref'])
+    if ref_count == -1:
+        return None
+    if not visit(address, du_args, visited_ptrs):
+        return None
+    return ref_count
+
+
+def qt_list_is_indirect(element_type):
+    """ QList stores elements bigger than pointer, and elements that are not
+    movable, in separately allocated nodes. QTypeInfo is not available
+    in debug info, so assume that just scalars and Qt types are movable.
+    """
+    t = element_type.strip_typedefs()
+    if t.sizeof > du.sizeof_ptr:
+        return True
+    return is_container_type(t) and not str(t).startswith('Q')
+
 
-    for i in range(0, array_size):
-        if level < du_args.print_level_limit:
-            gdb.write('%s %d: ' % (indent, i))
+def du_qt_list(s, level, du_args, visited_ptrs):
+    """ Qt5 QList<T>, QListData::Data block with array of pointers or inline elements """
+    element_type = s.type.strip_typedefs().template_argument(0)
 
-        entry = arr[i]
-        address = str(entry.address)
-        if address in visited_ptrs:
-            if level < du_args.print_level_limit:
-                gdb.write(' %s // visited already\n' % address)
-            size -= entry.type.sizeof
+    d = s['d']
+    ref_count = qt_shared_data(d, level, du_args, visited_ptrs)
+    if ref_count is None:
+        return 0
+
+    alloc = int(d['alloc'])
+    begin = int(d['begin'])
+    count = int(d['end']) - begin
+    # pointer to the first slot, "array" is declared with one element only
+    slots = d['array'][0].address
+    # Data is allocated with "alloc" elements of array, sizeof(Data) includes one
+    size = d.dereference().type.sizeof + (alloc - 1) * du.sizeof_ptr
+    qt_account_shared(ref_count, size, du_args)
+
+    indirect = qt_list_is_indirect(element_type)
+    if indirect:
+        size += count * element_type.sizeof
+        element_at = lambda i: slots[begin + i].cast(element_type.pointer()).dereference()
+    else:
+        element_at = lambda i: (slots + begin + i).cast(element_type.pointer()).dereference()
+
+    try:
+        size += du_follow_elements(element_at, count, level, du_args, visited_ptrs)
+    except DuInterrupted as e:
+        raise interrupted(e, size)
+
+    return size
+
+
+def du_follow_node_fields(node, skip, level, du_args, visited_ptrs):
+    """ follow fields of container node (key, value), except fields in "skip",
+    base classes and anonymous unions - they are used for linking nodes together
+    """
+    size = 0
+    for k in node.type.strip_typedefs().fields():
+        if k.is_base_class or not k.name or k.name in skip:
             continue
-        # gdb.write('%s ' % (address))
-        visited_ptrs.append(address)
-        size += du_follow(entry, level+1, du_args, visited_ptrs)
+        v = node[k]
+        if is_pointer(v):
+            size += du_follow_child('field', k.name, v, du_follow_pointer, level + 1, du_args, visited_ptrs)
+        else:
+            size += du_follow_child('field', k.name, v, du_follow, level + 1, du_args, visited_ptrs)
+    return size
+
 
+def du_follow_hash_node(node, level, du_args, visited_ptrs):
+    return du_follow_node_fields(node, ('next', 'h'), level, du_args, visited_ptrs)
+
+
+def du_follow_map_node(node, level, du_args, visited_ptrs):
+    return du_follow_node_fields(node, (), level, du_args, visited_ptrs)
+
+
+def du_qt_hash(s, level, du_args, visited_ptrs):
+    """ Qt5 QHash<K, V>, QHashData with array of buckets, buckets are
+    single linked lists of nodes terminated by pointer to QHashData
+    """
+    d = s['d']
+    ref_count = qt_shared_data(d, level, du_args, visited_ptrs)
+    if ref_count is None:
+        return 0
+
+    node_ptr_type = s['e'].type.strip_typedefs()
+    end = int(d)
+    count = int(d['size'])
+    num_buckets = int(d['numBuckets'])
+    node_size = int(d['nodeSize'])
+    size = d.dereference().type.sizeof + num_buckets * du.sizeof_ptr + count * node_size
+    qt_account_shared(ref_count, size, du_args)
+
+    buckets = []
+    if num_buckets > 0:
+        buckets = read_pointers(int(d['buckets']), num_buckets)
+    du_args.bytes_read += num_buckets * du.sizeof_ptr
+
+    i = 0
+    try:
+        for bucket in buckets:
+            address = bucket
+            while address != end and address != 0:
+                check_progress(du_args)
+                node = gdb.Value(address).cast(node_ptr_type).dereference()
+                du_args.derefs += 1
+                du_args.bytes_read += node_size
+                size += du_follow_child('index', i, node, du_follow_hash_node, level, du_args, visited_ptrs)
+                address = int(node['next'])
+                i += 1
+    except (DuInterrupted, KeyboardInterrupt) as e:
+        raise interrupted(e, size, count - i - 1)
 
-    if level < du_args.print_level_limit:
-        gdb.write('%s],\n' % (indent))
     return size
 
 
-def du_follow_std_vector(s, level, du_args, visited_ptrs):
-    indent = ' ' * level
-    if level < du_args.print_level_limit:
-        gdb.write('%s [' % s.type)
+def qt_map_node_type(map_data_type):
+    """ QMapNode<K, V> type for QMapData<K, V> """
+    for name in ('%s::Node' % map_data_type,
+                 'QMapNode<%s, %s>' % (map_data_type.template_argument(0),
+                                       map_data_type.template_argument(1))):
+        node_type = safe_caching_lookup_type(name)
+        if node_type is not None:
+            return node_type
+    return None
+
 
+def du_qt_map(s, level, du_args, visited_ptrs):
+    """ Qt5 QMap<K, V>, QMapData with red-black tree of nodes """
+    d = s['d']
+    ref_count = qt_shared_data(d, level, du_args, visited_ptrs)
+    if ref_count is None:
+        return 0
+
+    map_data_type = d.dereference().type.strip_typedefs()
+    node_type = qt_map_node_type(map_data_type)
+    count = int(d['size'])
+    node_size = node_type.sizeof if node_type is not None else safe_caching_lookup_type('QMapNodeBase').sizeof
+    size = map_data_type.sizeof + count * node_size
+    qt_account_shared(ref_count, size, du_args)
+
+    if node_type is None:
+        return size
+
+    # iterative in-order walk, tree may be deep
+    node_ptr_type = node_type.pointer()
+    stack = []
+    node = d['header']['left']
+    i = 0
+    try:
+        while stack or int(node) != 0:
+            if int(node) != 0:
+                stack.append(node)
+                node = node['left']
+                continue
+            node = stack.pop()
+            check_progress(du_args)
+            value = node.cast(node_ptr_type).dereference()
+            du_args.derefs += 1
+            du_args.bytes_read += node_size
+            size += du_follow_child('index', i, value, du_follow_map_node, level, du_args, visited_ptrs)
+            i += 1
+            node = node['right']
+    except (DuInterrupted, KeyboardInterrupt) as e:
+        raise interrupted(e, size, count - i - 1)
+
+    return size
+
+
+def read_pointers(address, count):
+    """ read array of pointers from inferior memory by single read """
+    memory = gdb.selected_inferior().read_memory(address, count * du.sizeof_ptr)
+    return memory.cast('Q' if du.sizeof_ptr == 8 else 'I')
+
+
+def sample_indices(count, du_args):
+    """ return indices of array elements to follow, sorted, and flag if it is just a sample """
+    if 0 < du_args.sample < count:
+        return sorted(du_args.random.sample(range(count), du_args.sample)), True
+    return range(count), False
+
+
+class ElementLayout(object):
+    """ members of array element type which may own memory, for du_follow_strided.
+    Entries are tuples (kind, offset, aux, level, names), where kind is
+      'ptr'    - pointer of "aux" type, followed on "level" as du_follow_pointer
+      'string' - std::string, "aux" are offsets of data pointer, local buffer
+                 and capacity, and sizeof of the string
+      'value'  - member of "aux" type followed by du_follow on "level"
+    level is relative to the array, names are field names of the member path.
+    objfiles are filenames of objfiles defining the types of the layout,
+    None when it is not known.
+    """
+    __slots__ = ('entries', 'has_static', 'depth', 'objfiles')
+
+    def __init__(self):
+        self.entries = []
+        self.has_static = False
+        self.depth = 0
+        self.objfiles = set()
+
+    def add(self, kind, offset, aux, level, names):
+        self.entries.append((kind, offset, aux, level, names))
+        self.depth = max(self.depth, level)
+
+
+__layouts = {}
+
+
+def type_objfile(type):
+    """ filename of objfile defining the type, '' for types of architecture
+    (int, char...), None when it is not known (gdb < 9) """
+    if not hasattr(type, 'objfile'):
+        return None
+    objfile = type.objfile
+    return objfile.filename if objfile is not None else ''
+
+
+def element_layout(type):
+    """ cached ElementLayout of the type """
+    key = type.name
+    if key is None:
+        key = str(type)
+    # types of the same name may differ between objfiles
+    key = (key, type_objfile(type.strip_typedefs()))
+    layout = __layouts.get(key)
+    if layout is None:
+        layout = ElementLayout()
+        build_layout(layout, type, 0, 1, ())
+        __layouts[key] = layout
+    return layout
+
+
+def forget_layouts(event):
+    """ drop layouts of types of the loaded objfile, it replaces the objfile
+    of the same name (reloaded library), layouts of other objfiles are kept """
+    filename = event.new_objfile.filename
+    for key in [key for key, layout in __layouts.items()
+                if filename in layout.objfiles or None in layout.objfiles]:
+        del __layouts[key]
+
+
+def clear_layouts(event=None):
+    """ layouts and handlers of types are cached by type name,
+    types of unloaded objfiles are not valid anymore """
+    __layouts.clear()
+    handlers.clear_cache()
+
+
+gdb.events.new_objfile.connect(forget_layouts)
+gdb.events.clear_objfiles.connect(clear_layouts)
+
+
+def build_layout(layout, type, offset, level, names):
+    """ add members of the type to the layout, it mirrors what du_follow does """
+    t = type.strip_typedefs()
+    if t.code == gdb.TYPE_CODE_PTR:
+        # array of pointers, pointer members are added by the loop below
+        target = t.target().strip_typedefs()
+        if target.code not in (gdb.TYPE_CODE_VOID, gdb.TYPE_CODE_FUNC):
+            layout.add('ptr', offset, t, level, names)
+            layout.objfiles.add(type_objfile(target))
+        return
+    if t.code == gdb.TYPE_CODE_ARRAY:
+        element = element_layout(t.target())
+        if element.entries:
+            layout.add('value', offset, t, level, names)
+        layout.has_static = layout.has_static or element.has_static
+        layout.objfiles.update(element.objfiles)
+        return
+    if not is_container_type(t):
+        return
+    layout.objfiles.add(type_objfile(t))
+    handler = handlers.lookup(type)
+    if handler is du_string:
+        layout.add('string', offset, (member_offset(t, '_M_dataplus', '_M_p'),
+                                      member_offset(t, '_M_local_buf'),
+                                      member_offset(t, '_M_allocated_capacity'), t.sizeof), level, names)
+        return
+    if handler is not None:
+        layout.add('value', offset, t, level, names)
+        return
+    if t.code == gdb.TYPE_CODE_UNION:
+        # members of unions are not followed
+        return
+    for k in t.fields():
+        if not hasattr(k, 'bitpos'): # static
+            layout.has_static = True
+            continue
+        field_offset = offset + k.bitpos // 8
+        field_type = k.type.strip_typedefs()
+        # base classes and anonymous members are transparent, like in du_follow_struct
+        field_names = names + (k.name,) if k.name and not k.is_base_class else names
+        if field_type.code == gdb.TYPE_CODE_PTR:
+            target = field_type.target().strip_typedefs()
+            if target.code not in (gdb.TYPE_CODE_VOID, gdb.TYPE_CODE_FUNC):
+                layout.add('ptr', field_offset, field_type, level, field_names)
+                layout.objfiles.add(type_objfile(target))
+        elif is_container_type(field_type) or field_type.code == gdb.TYPE_CODE_ARRAY:
+            build_layout(layout, k.type, field_offset, level + 1, field_names)
+
+
+def member_offset(type, *names):
+    """ offset of (nested) member, it may be member of anonymous union """
+    v = gdb.Value(0).cast(type.pointer()).dereference()
+    for name in names:
+        v = v[name]
+    return int(v.address)
+
+
+def strided_words(buf, offset, stride, count):
+    """ pointer sized words at offset of every element of array in the buffer """
+    fmt = 'Q' if du.sizeof_ptr == 8 else 'I'
+    if offset % du.sizeof_ptr == 0 and stride % du.sizeof_ptr == 0:
+        words = memoryview(buf).cast('B')[:count * stride].cast(fmt)
+        return words[offset // du.sizeof_ptr::stride // du.sizeof_ptr].tolist()
+    return [struct.unpack_from(fmt, buf, offset + i * stride)[0] for i in range(count)]
+
+
+def readable_targets(targets, sizeof, du_args):
+    """ filter readable addresses, nearby targets are read by single read """
+    readable = []
+    for addresses, start, bytebuf in iter_memory_regions(targets, sizeof):
+        du_args.fetches += 1
+        if bytebuf is not None:
+            du_args.bytes_read += len(bytebuf)
+            readable.extend(addresses)
+    return readable
+
+
+def du_follow_target(address, sizeof, readable, du_args, visited_ptrs):
+    """ pointed value without members owning memory, read already by readable_targets """
+    if visit(address, du_args, visited_ptrs) and address in readable:
+        return sizeof
+    return 0
+
+
+def du_follow_layout_entry(entry, buf, base, stride, count, live, level, du_args, visited_ptrs, ownership=None):
+    """ follow one member of live elements (indices) of array in buf.
+    With ownership, memory owned by the member is added to the unit of its element.
+    """
+    kind, offset, type, entry_level, names = entry
+    size = 0
+    if kind == 'string':
+        data_offset, local_offset, capacity_offset = [offset + o for o in type[:3]]
+        data = strided_words(buf, data_offset, stride, count)
+        capacity = strided_words(buf, capacity_offset, stride, count)
+        for i in live:
+            if data[i] != base + i * stride + local_offset: # see std::string::_M_is_local
+                size += capacity[i]
+                if ownership is not None:
+                    ownership.within(base + i * stride, int, capacity[i])
+    elif kind == 'ptr':
+        ptrs = strided_words(buf, offset, stride, count)
+        target = type.target()
+        if is_container_type(target):
+            for i in live:
+                if ptrs[i] == 0:
+                    continue
+                v = gdb.Value(ptrs[i]).cast(type)
+                if ownership is None:
+                    size += du_follow_pointer(v, level + entry_level, du_args, visited_ptrs)
+                else:
+                    size += ownership.within(base + i * stride, du_follow_pointer,
+                                             v, level + entry_level, du_args, visited_ptrs)
+        elif ownership is not None:
+            # every pointed value is a unit of its own, owned by the element
+            sizeof, alignment = target.sizeof, type_alignment(target)
+            valid = []
+            for i in live:
+                if ptrs[i] == 0:
+                    continue
+                if not looks_like_ptr(ptrs[i], sizeof, alignment):
+                    du_args.invalid_ptrs += 1
+                else:
+                    valid.append(i)
+            readable = set(readable_targets(sorted(set(ptrs[i] for i in valid if ptrs[i] not in ownership.units)),
+                                            sizeof, du_args))
+            for i in valid:
+                size += ownership.within(base + i * stride, ownership.track, du_follow_target,
+                                         ptrs[i], sizeof, readable, du_args, visited_ptrs)
+        else:
+            sizeof, alignment = target.sizeof, type_alignment(target)
+            candidates = []
+            for i in live:
+                if ptrs[i] == 0:
+                    continue
+                if not looks_like_ptr(ptrs[i], sizeof, alignment):
+                    du_args.invalid_ptrs += 1
+                elif visit(ptrs[i], du_args, visited_ptrs):
+                    candidates.append(ptrs[i])
+            size += len(readable_targets(candidates, target.sizeof, du_args)) * target.sizeof
+    else:
+        ptr_type = type.pointer()
+        for i in live:
+            v = gdb.Value(base + i * stride + offset).cast(ptr_type).dereference()
+            du_args.derefs += 1
+            if ownership is None:
+                size += du_follow(v, level + entry_level, du_args, visited_ptrs)
+            else:
+                size += ownership.within(base + i * stride, du_follow, v, level + entry_level, du_args, visited_ptrs)
+    return size
+
+
+# maximal size of array chunk read by single read
+STRIDED_CHUNK = 1 << 22
+
+
+def du_follow_strided(address, element_type, count, level, du_args, visited_ptrs, inline=False):
+    """ follow array elements like du_follow_elements, but without gdb.Value
+    per element and member. Array is read in big chunks, pointers and sizes
+    are decoded for all elements at once, by cached layout of element type.
+    """
+    layout = element_layout(element_type)
+    stride = element_type.sizeof
+    chunk = max(1, STRIDED_CHUNK // max(1, stride))
+    # elements of inline arrays are not units, they are part of the enclosing one
+    ownership = du_args.ownership if not inline else None
+    result = du_args.result
+    if result is not None:
+        node = result.enter('index', None, element_type, address)
+        result.suspended += 1
+    folded = du_args.folded
+    if folded is not None:
+        parent_frame = folded.current
+        element_frame = folded.child(parent_frame, 'index', None)
+        entry_frames = []
+        # members are stored in the element, their sizeof is moved to their frames
+        entry_sizeofs = []
+        for entry in layout.entries:
+            frame = element_frame
+            for name in entry[4]:
+                frame = folded.intern(frame, name)
+            entry_frames.append(frame)
+            entry_sizeofs.append(entry[2][3] if entry[0] == 'string' else entry[2].sizeof)
+    inferior = gdb.selected_inferior()
+    size = 0
+    done = 0
+    try:
+        while done < count:
+            n = min(chunk, count - done)
+            base = address + done * stride
+            if inline:
+                visited = ()
+            else:
+                addresses = range(base, base + n * stride, stride)
+                if ownership is not None:
+                    # every element is a unit, like in du_follow_element
+                    visited = ownership.visit_many(addresses)
+                else:
+                    visited = visited_ptrs.intersection(addresses)
+                    visited_ptrs.update(addresses)
+                du_args.visits += n
+                du_args.visited_hits += len(visited)
+                size -= len(visited) * stride
+            if folded is not None:
+                folded.add_child(parent_frame, element_frame, (n - len(visited)) * stride)
+            if layout.entries:
+                buf = inferior.read_memory(base, n * stride)
+                du_args.bytes_read += n * stride
+                if visited:
+                    live = [i for i in range(n) if base + i * stride not in visited]
+                else:
+                    live = range(n)
+                for e, entry in enumerate(layout.entries):
+                    if folded is None:
+                        size += du_follow_layout_entry(entry, buf, base, stride, n, live, level, du_args, visited_ptrs, ownership)
+                        continue
+                    folded.current = entry_frames[e]
+                    try:
+                        entry_size = du_follow_layout_entry(entry, buf, base, stride, n, live, level, du_args, visited_ptrs, ownership)
+                    finally:
+                        folded.current = parent_frame
+                    folded.add_child(parent_frame, entry_frames[e], entry_size)
+                    folded.add_child(element_frame, entry_frames[e], len(live) * entry_sizeofs[e])
+                    size += entry_size
+            done += n
+            du_args.nodes += n
+            report_progress(du_args)
+    except (DuInterrupted, KeyboardInterrupt) as e:
+        raise interrupted(e, size, count - done)
+    finally:
+        if result is not None:
+            result.suspended -= 1
+    if result is not None:
+        result.leave(node, count * stride + size)
+    return size
+
+
+def du_follow_element(entry, i, level, du_args, visited_ptrs, inline=False):
+    """ follow i-th array element, returns negative sizeof of element visited already,
+    it is counted in the array storage and by the pointer it was visited by.
+    Elements of inline arrays (struct members) are not visited by address.
+    """
+    if not inline:
+        address = int(entry.address)
+        if not visit(address, du_args, visited_ptrs):
+            return -entry.type.sizeof
+    du_args.bytes_read += entry.type.sizeof
+    follow = du_follow
+    if is_pointer(entry):
+        follow = du_follow_pointee if du_args.ownership is None else du_follow_pointer
+    if du_args.path is None and du_args.folded is None and du_args.result is None:
+        return int(follow(entry, level+1, du_args, visited_ptrs))
+    return int(du_follow_child('index', i, entry, follow, level+1, du_args, visited_ptrs))
+
+
+def du_follow_elements(element_at, count, level, du_args, visited_ptrs, address=None, element_type=None, inline=False):
+    """ follow first "count" array elements, returned by element_at(i) callback.
+    Returns size allocated by elements, array storage itself is not included.
+    With sampling enabled, just random subset of elements is followed
+    and the size is extrapolated.
+    When array address and element type are known, elements are not recorded
+    in the result tree separately, not filtered by path and indices are not
+    folded separately, du_follow_strided is used.
+    """
+    if (address is not None and du_args.strided
+            and not 0 < du_args.sample < count
+            and (du_args.path is None or du_args.path.settled(du_args.path_state))
+            and (du_args.folded is None or du_args.folded.collapse_indices)):
+        layout = element_layout(element_type)
+        if (not (layout.has_static and du_args.follow_static)
+                and level + layout.depth + 1 < du_args.level_limit):
+            return du_follow_strided(address, element_type, count, level, du_args, visited_ptrs, inline)
+
+    indices, sampled = sample_indices(count, du_args)
+    if sampled:
+        # even sample of equal sizes (zero variance) is an estimate
+        du_args.sampled = True
+    variance = du_args.sample_variance
+    sizes = []
+    try:
+        for i in indices:
+            if du_args.path is not None and du_args.path.step(du_args.path_state, 'index', i) is None:
+                sizes.append(0)
+                continue
+            entry = element_at(i)
+            du_args.derefs += 1
+            if du_args.ownership is not None:
+                sizes.append(du_args.ownership.track(du_follow_element, entry, i, level, du_args, visited_ptrs, inline))
+            else:
+                sizes.append(du_follow_element(entry, i, level, du_args, visited_ptrs, inline))
+    except (DuInterrupted, KeyboardInterrupt) as e:
+        raise interrupted(e, sum(sizes), len(indices) - len(sizes) - 1)
+
+    if not sampled:
+        return sum(sizes)
+
+    # Extrapolate sample to the whole array. Variance of nested samples
+    # is part of variance between sampled elements already,
+    # so it is replaced by the variance of this estimate.
+    n = len(sizes)
+    stdev = statistics.stdev(sizes) if n > 1 else 0.0
+    # standard error of the total, with finite population correction
+    error = count * stdev / math.sqrt(n) * math.sqrt((count - n) / (count - 1))
+    du_args.sample_variance = variance + error * error
+    estimate = int(round(statistics.fmean(sizes) * count))
+    return estimate
+
+
+def du_follow_std_vector(s, level, du_args, visited_ptrs):
     start = s['_M_impl']['_M_start'].dereference()
     end = s['_M_impl']['_M_finish'].dereference()
     storage_end = s['_M_impl']['_M_end_of_storage'].dereference()
+    du_args.derefs += 3
 
-    vec_size = end.address - start.address
-    vec_capacity = storage_end.address - start.address
+    vec_size = int(end.address - start.address)
+    vec_capacity = int(storage_end.address - start.address)
     size = vec_capacity * start.type.sizeof
-    if level < du_args.print_level_limit:
-        gdb.write('%s // vector size: %d, capacity: %d\n' % (indent, vec_size, vec_capacity))
-
-    for i in range(0, vec_size):
-        if level < du_args.print_level_limit:
-            gdb.write('%s %d: ' % (indent, i))
-        entry = s['_M_impl']['_M_start'][i]
-        address = str(entry.address)
-        if address in visited_ptrs:
-            if level < du_args.print_level_limit:
-                gdb.write(' %s // visited already\n' % address)
-            size -= entry.type.sizeof
-            continue
-        # gdb.write('%s ' % (address))
-        visited_ptrs.append(address)
-        size += du_follow(entry, level+1, du_args, visited_ptrs)
 
-    if level < du_args.print_level_limit:
-        gdb.write('%s],\n' % (indent))
+    arr = s['_M_impl']['_M_start']
+    try:
+        size += du_follow_elements(lambda i: arr[i], vec_size, level, du_args, visited_ptrs,
+                                   int(arr), start.type)
+    except DuInterrupted as e:
+        raise interrupted(e, size)
+
     return size
 
 
-def du_follow(s, level = 0, du_args = DuArgs, visited_ptrs = []):
-    indent = ' ' * level
+def find_member(s, name, depth=8):
+    """ nested struct (base or member) of s with member name, None when not found """
+    pending = [(s, 0)]
+    while pending:
+        v, d = pending.pop(0)
+        fields = v.type.strip_typedefs().fields()
+        if any(k.name == name for k in fields):
+            return v
+        if d < depth:
+            pending.extend((v[k], d + 1) for k in fields
+                           if hasattr(k, 'bitpos') and is_container_type(k.type.strip_typedefs()))
+    return None
+
+
+def du_follow_inline(name, v, level, du_args, visited_ptrs):
+    """ value stored inline (payload of optional, alternative of variant), its sizeof is counted by the caller """
+    if is_pointer(v):
+        return du_follow_child('field', name, v, du_follow_pointer, level, du_args, visited_ptrs)
+    return du_follow_child('field', name, v, du_follow, level + 1, du_args, visited_ptrs)
+
+
+def du_std_optional(s, level, du_args, visited_ptrs):
+    """ std::optional, payload is followed just when it is engaged """
+    payload = find_member(s, '_M_engaged')
+    if payload is None or not payload['_M_engaged']:
+        return 0
+    v = payload['_M_payload']
+    if v.type.strip_typedefs().code == gdb.TYPE_CODE_UNION:
+        v = v['_M_value']
+    size = du_follow_inline('value', v, level, du_args, visited_ptrs)
+    return size
+
+
+def du_std_variant(s, level, du_args, visited_ptrs):
+    """ std::variant, just the active alternative is followed """
+    storage = find_member(s, '_M_index')
+    if storage is None:
+        return 0
+    index = storage['_M_index']
+    index_value = int(index)
+    if index_value == (1 << (8 * index.type.sizeof)) - 1 or index_value < 0:
+        # variant_npos
+        return 0
+    try:
+        u = storage['_M_u']
+        for _ in range(index_value):
+            u = u['_M_rest']
+        v = u['_M_first']['_M_storage']
+        storage_type = v.type.strip_typedefs()
+        if (storage_type.name or '').startswith('__gnu_cxx::__aligned_membuf'):
+            alternative = storage_type.template_argument(0)
+            v = v.address.cast(alternative.pointer()).dereference()
+    except gdb.error:
+        return 0
+    size = du_follow_inline('value', v, level, du_args, visited_ptrs)
+    return size
+
 
+def du_follow(s, level = 0, du_args = None, visited_ptrs = None):
     # TODO: handle s.dynamic_type
+    if du_args is None:
+        du_args = DuArgs()
+    if visited_ptrs is None:
+        visited_ptrs = set()
 
     if not is_container(s):
-        if level < du_args.print_level_limit:
-            gdb.write('%s\n' % s)
-        return 0
+        if not is_owning_array(s.type, du_args):
+            return 0
+        handler = du_follow_array
+    else:
+        check_progress(du_args)
+
+        if level >= du_args.level_limit:
+            du_args.depth_limited += 1
+            return 0 # don't go deeper!
+
+        handler = handlers.lookup(s.type)
+        if handler is None:
+            if s.type.strip_typedefs().code == gdb.TYPE_CODE_UNION:
+                # active member is not known, pointers in other members are garbage
+                return 0
+            handler = du_follow_struct
+
+    # handler is called directly, without helper frames per level of the graph,
+    # ownership of memory visited by the handler is tracked with "du --joint"
+    if du_args.ownership is not None:
+        return du_args.ownership.track(du_call_timed, handler, s, level, du_args, visited_ptrs)
+    if du_args.stats is not None:
+        return du_args.stats.call(handler.__name__, handler, s, level, du_args, visited_ptrs)
+    return handler(s, level, du_args, visited_ptrs)
+
+
+def du_follow_array(s, level, du_args, visited_ptrs):
+    """ fixed size array (C array, storage of std::array), elements are stored inline """
+    t = s.type.strip_typedefs()
+    element_type = t.target()
+    count = t.sizeof // element_type.sizeof if element_type.sizeof else 0
+    address = int(s.address) if s.address is not None else None
+    try:
+        size = du_follow_elements(lambda i: s[i], count, level, du_args, visited_ptrs,
+                                  address, element_type, inline=True)
+    except DuInterrupted as e:
+        raise interrupted(e, 0)
+    return size
 
-    if level >= du_args.level_limit:
-        gdb.write("!! limit reached\n")
-        return 0 # don't go deeper!
 
-    if level == du_args.print_level_limit:
-        gdb.write('%s { ... },\n' % s.type) # last level to print
+def du_follow_struct(s, level, du_args, visited_ptrs):
+    """ generic container (struct) """
+    size = 0
+    fields = s.type.fields()
+    # children are followed directly when they are not recorded, frames
+    # per level of the graph limit depth of linked structures
+    direct = du_args.path is None and du_args.folded is None and du_args.result is None
+    follow_pointer = du_follow_pointee if du_args.ownership is None else du_follow_pointer
+    try:
+        for i, k in enumerate(fields):
+            # base classes and anonymous members are transparent for path filter
+            kind = 'field' if k.name and not k.is_base_class else None
+            if du_args.path is not None and kind is not None:
+                if du_args.path.step(du_args.path_state, kind, k.name) is None:
+                    continue
+            v = s[k]
+            if is_pointer(v):
+                if direct:
+                    size += follow_pointer(v, level, du_args, visited_ptrs)
+                else:
+                    size += du_follow_child(kind, k.name, v, follow_pointer, level, du_args, visited_ptrs)
+            elif hasattr(k, 'enumval'):
+                continue
+            elif not hasattr(k, 'bitpos'): # static
+                if v.address is not None and du_args.follow_static:
+                    # followed as pointer, but the pointer is not stored in the struct
+                    size += du_follow_child(kind, k.name, v.address, follow_pointer, level, du_args, visited_ptrs,
+                                            stored=False)
+            elif is_container(v) or is_owning_array(k.type, du_args):
+                if direct:
+                    size += du_follow(v, level + 1, du_args, visited_ptrs)
+                else:
+                    size += du_follow_child(kind, k.name, v, du_follow, level + 1, du_args, visited_ptrs)
+            else:
+                if du_args.path is not None:
+                    du_follow_child(kind, k.name, v, du_follow_scalar, level, du_args, visited_ptrs)
+    except (DuInterrupted, KeyboardInterrupt) as e:
+        raise interrupted(e, size, len(fields) - i - 1)
+    return size
 
-    # known TLS containers
-    if get_typedef(s.type, 'std::vector') is not None:
-        return du_follow_std_vector(s, level, du_args, visited_ptrs)
 
-    if s.type == safe_caching_lookup_type('std::string'):
-        return du_string(s, level, du_args, visited_ptrs)
+# known STL containers
+register_handler(du_follow_std_vector, prefix='std::vector')
+register_handler(du_string, prefix='std::string')
+register_handler(du_string, prefix='std::__cxx11::basic_string<char,')
+register_handler(du_std_optional, prefix='std::optional<')
+register_handler(du_std_variant, prefix='std::variant<')
 
-    if get_typedef(s.type, 'std::string') is not None:
-        return du_string(s, level, du_args, visited_ptrs)
+# special handling of Qt containers
+register_handler(du_qt_string_data, prefix='QString::Data')
+register_handler(du_qt_array_data, prefix='QTypedArrayData')
+register_handler(du_qt_array_data, prefix='QArrayData')
+# not nested types like QHash<K, V>::iterator
+register_handler(du_qt_list, regex=template_regex('QList'))
+register_handler(du_qt_hash, regex=template_regex('QHash'))
+register_handler(du_qt_map, regex=template_regex('QMap'))
 
-    # special handling of Qt containers
-    qtStringData = get_typedef(s.type, 'QString::Data')
-    qtTypedArrayData = get_typedef(s.type, 'QTypedArrayData')
-    if qtStringData is not None and qtTypedArrayData is not None:
-        element_type = qtTypedArrayData.template_argument(0)
-        return du_qt_string_data(s, element_type, level, du_args, visited_ptrs)
 
-    if qtTypedArrayData is not None:
-        # TODO: handle possible pointers in s.type
-        element_type = qtTypedArrayData.template_argument(0)
-        return du_qt_array_data(s, element_type, level, du_args, visited_ptrs)
+def du_root(name, v, du_args, visited_ptrs):
+    """
+    Size of root variable, including its sizeof. Returns None when the variable
+    was reached from previous root already.
+    """
+    if v.address is not None and not visit(int(v.address), du_args, visited_ptrs):
+        return None
+    return du_follow_root(name, v, du_args, visited_ptrs)
 
-    qtArrayData = get_typedef(s.type, 'QArrayData')
-    if qtArrayData is not None:
-        # not sure about array type, QTypedArrayData should be detected usually...
-        element_type = safe_caching_lookup_type('char')
-        return du_qt_array_data(s, element_type, level, du_args, visited_ptrs)
 
-    # generic container (struct)
-    if level < du_args.print_level_limit:
-        gdb.write('%s {\n' % s.type)
+def du_follow_root(name, v, du_args, visited_ptrs):
+    """
+    Size of value (expression or variable) called "name", including its sizeof.
+    With path filter, just size of matched subtrees.
+    """
+    folded = du_args.folded
+    result = du_args.result
+    if folded is None and result is None:
+        return du_follow_path_root(name, v, du_args, visited_ptrs)
+    if folded is not None:
+        parent = folded.current
+        frame = folded.intern(parent, name)
+        folded.current = frame
+    if result is not None:
+        node = result.enter('name', name, v.type, v.address)
+    try:
+        size = du_follow_path_root(name, v, du_args, visited_ptrs)
+    finally:
+        if folded is not None:
+            folded.current = parent
+    if folded is not None:
+        folded.add_child(parent, frame, size)
+    if result is not None:
+        result.leave(node, size)
+    return size
 
-    size = 0
-    for k in s.type.fields():
-        v = s[k]
-        if is_pointer(v):
-            if level < du_args.print_level_limit:
-                gdb.write('%s %s: %s' % (indent, k.name, v))
-            size += du_follow_pointer(v, level, du_args, visited_ptrs)
-        elif hasattr(k, 'enumval'):
-            if level < du_args.print_level_limit:
-                gdb.write('%s %s: %s, // enumval\n' % (indent, k.name, v))
-        elif not hasattr(k, 'bitpos'): # static
-            if level < du_args.print_level_limit:
-                gdb.write('%s static %s: %s\n' % (indent, k.name, v))
-            if v.address is not None and du_args.follow_static:
-                size += du_follow_pointer(v.address, level, du_args, visited_ptrs)
-        elif is_container(v):
-            if level < du_args.print_level_limit:
-                gdb.write('%s %s: ' % (indent, k.name))
-            size += du_follow(v, level + 1, du_args, visited_ptrs)
+
+def du_follow_root_value(v, du_args, visited_ptrs):
+    """ follow root value, pointers (like "static Foo *instance") are followed
+    as pointer members of structures """
+    if is_pointer(v):
+        return du_follow_pointer(v, 0, du_args, visited_ptrs)
+    return du_follow(v, 0, du_args, visited_ptrs)
+
+
+def du_follow_path_root(name, v, du_args, visited_ptrs):
+    path = du_args.path
+    if path is None:
+        try:
+            return int(v.type.sizeof + du_follow_root_value(v, du_args, visited_ptrs))
+        except (DuInterrupted, KeyboardInterrupt) as e:
+            raise interrupted(e, v.type.sizeof)
+
+    state = path.root(name)
+    if state is None:
+        return 0
+    du_args.path_state = state
+    matched = du_args.path_bytes
+    try:
+        size = du_follow_root_value(v, du_args, visited_ptrs)
+    except (DuInterrupted, KeyboardInterrupt) as e:
+        e = interrupted(e, 0)
+        if not path.matched(state):
+            # just completed matches are known
+            e.partial = du_args.path_bytes - matched
+        raise e
+    if path.matched(state):
+        return int(v.type.sizeof + size)
+    return du_args.path_bytes - matched
+
+
+def make_du_args(compute_depth=1024, follow_static=False, sample=0, seed=None,
+                 deadline=None, progress=False, stats=False, paths=(), excludes=(),
+                 folded=None, collapse_arrays=True):
+    """ DuArgs with options of du.measure """
+    du_args = DuArgs()
+    du_args.level_limit = compute_depth
+    du_args.follow_static = follow_static
+    du_args.sample = sample
+    du_args.random.seed(seed)
+    du_args.deadline = deadline
+    if not progress:
+        du_args.progress_interval = None
+    if stats:
+        du_args.stats = DuStats()
+    if paths or excludes:
+        du_args.path = PathFilter(paths, excludes)
+    du_args.folded = folded
+    du_args.strided = collapse_arrays
+    return du_args
+
+
+# Python frames per level of the traversal, at most (with --joint, --stats,
+# --path and --folded), recursion limit is raised for the compute depth
+FRAMES_PER_LEVEL = 12
+# C stack of Python < 3.11 limits the recursion as well
+MAX_RECURSION_LIMIT = 50000
+
+
+def measure(value, name='value', **opts):
+    """
+    Measure memory used by gdb.Value, returns DuResult. Options are keyword
+    arguments of measure_roots and make_du_args, nothing is printed.
+    With tree=False, just the size is computed, without the tree of nodes.
+    With collapse_arrays (default), elements of arrays are sized in bulk
+    when possible, they are represented by single "[*]" node then.
+    """
+    return measure_roots([(name, value)], **opts)
+
+
+def measure_roots(roots, tree=True, tree_depth=None, timeout=None, joint=False, **opts):
+    """
+    Measure (name, gdb.Value) roots by single traversal, returns DuResult
+    with size of every root in result.roots. Memory reachable from multiple
+    roots is charged to the first one, with joint=True it is tracked
+    by result.du_args.ownership and reported as shared by its sizes().
+    Roots may be a generator, every root is read when it is reached.
+    With tree_depth, just nodes up to that depth are recorded (roots are 0).
+    Graph deeper than the recursion limit allows gives incomplete result.
+    """
+    if timeout is not None:
+        opts['deadline'] = time.monotonic() + timeout
+    du_args = make_du_args(**opts)
+    if joint:
+        du_args.ownership = Ownership()
+    if tree:
+        du_args.result = ResultTree(tree_depth)
+    result = DuResult(0, du_args.result, du_args)
+    visited_ptrs = set()
+    in_root = False
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, min(MAX_RECURSION_LIMIT,
+                                                   recursion_limit + du_args.level_limit * FRAMES_PER_LEVEL)))
+    try:
+        for i, (name, v) in enumerate(roots):
+            in_root = True
+            if joint:
+                key = int(v.address) if v.address is not None else ('root', i)
+                if du_args.ownership.start_root(key):
+                    size = du_follow_root(name, v, du_args, visited_ptrs)
+                    du_args.ownership.finish_root(size)
+                else:
+                    size = None
+            else:
+                size = du_root(name, v, du_args, visited_ptrs)
+            in_root = False
+            result.roots.append(size)
+            result.size += size or 0
+    except (DuInterrupted, KeyboardInterrupt, RecursionError) as e:
+        if isinstance(e, RecursionError):
+            # partial size of the root is lost
+            e = DuInterrupted('recursion limit')
         else:
-            if level < du_args.print_level_limit:
-                gdb.write('%s %s: %s,\n' % (indent, k.name, v))
-    if level < du_args.print_level_limit:
-        gdb.write('%s},\n' % (indent))
-    return size
+            e = interrupted(e, 0)
+        if in_root:
+            result.roots.append(e.partial)
+            result.size += e.partial
+        result.complete = False
+        result.reason = e.reason
+        result.pending = e.pending
+        if result.tree is not None:
+            result.tree.close()
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+    return result
+
+
+def write_tree(node, max_depth, level=0):
+    """ print node of the result tree and its children, up to max_depth """
+    gdb.write('%s%s: %s // size: %d\n' % (' ' * level, node.name, node.type, node.size))
+    if level < max_depth:
+        for child in node.children():
+            write_tree(child, max_depth, level + 1)
 
 
 class ErrorCatchingArgumentParser(argparse.ArgumentParser):
@@ -291,26 +1335,57 @@ class ErrorCatchingArgumentParser(argparse.ArgumentParser):
 class Du(gdb.Command):
     '''
     du [-d PRINT_LEVEL_LIMIT] STRUCT-VALUE
+    du --globals [--top N]
+    du --all-threads [--frames N] [--top N]
+    du --path PATTERN [--exclude PATTERN] STRUCT-VALUE
+    du --folded FILE STRUCT-VALUE
     '''
     def __init__(self):
         super(Du, self).__init__(
             'du',
             gdb.COMMAND_DATA, gdb.COMPLETE_SYMBOL, False)
+        # FoldedStacks of the running command, for "du --folded"
+        self.folded = None
 
     def invoke(self, args, from_tty):
         arg_list = gdb.string_to_argv(args)
-        if len(arg_list) < 1:
-            gdb.write("Too few arguments\n")
-
         parser = ErrorCatchingArgumentParser(description='Compute memory size of structure.')
 
         parser.add_argument('-p', '--print-depth=', dest='print_depth', type=int, default=3,
-                            help='print depth (default: 3)')
+                            help='print depth of the result tree (default: 3)')
         parser.add_argument('-c', '--compute-depth=', dest='compute_depth', type=int, default=1024,
                             help='compute depth (default: 1024)')
         parser.add_argument('-s', '--static', dest='follow_static', default=False, action='store_true',
                             help='follow static fields (default is false)')
-        parser.add_argument('expression', metavar='expr', type=str, nargs='+',
+        parser.add_argument('--sample', dest='sample', type=int, default=0,
+                            help='follow just N random elements of each array and extrapolate (default: all)')
+        parser.add_argument('--confidence', dest='confidence', type=float, default=95,
+                            help='confidence level of sampled estimate, in percent (default: 95)')
+        parser.add_argument('--seed', dest='seed', type=int, default=None,
+                            help='random seed for sampling')
+        parser.add_argument('-t', '--timeout', dest='timeout', type=float, default=None,
+                            help='stop traversal after SECONDS and print partial result')
+        parser.add_argument('--no-progress', dest='progress', default=True, action='store_false',
+                            help='do not print progress of long traversal to stderr')
+        parser.add_argument('--stats', dest='stats', default=False, action='store_true',
+                            help='print time spent in handlers, number of gdb calls and cache hit rates')
+        parser.add_argument('--globals', dest='globals', default=False, action='store_true',
+                            help='rank global and static variables by size')
+        parser.add_argument('--all-threads', dest='all_threads', default=False, action='store_true',
+                            help='size local variables of all threads, per thread and per function')
+        parser.add_argument('--frames', dest='frames', type=int, default=None,
+                            help='number of innermost frames of each thread sized with --all-threads (default: all)')
+        parser.add_argument('--top', dest='top', type=int, default=20,
+                            help='number of rows printed with --globals and --all-threads (default: 20)')
+        parser.add_argument('--path', dest='paths', action='append', default=[], metavar='PATTERN',
+                            help='size just parts of structure matching the pattern, like "vec[*].stringMap"')
+        parser.add_argument('--exclude', dest='excludes', action='append', default=[], metavar='PATTERN',
+                            help='do not follow parts of structure matching the pattern')
+        parser.add_argument('--folded', dest='folded', default=None, metavar='FILE',
+                            help='write size by path in folded stack format (flamegraph.pl, speedscope)')
+        parser.add_argument('--no-collapse', dest='collapse_indices', default=True, action='store_false',
+                            help='keep array indices in --folded paths, instead of [*]')
+        parser.add_argument('expression', metavar='expr', type=str, nargs='*',
                             help='gdb expression (variable)')
 
         try:
@@ -318,6 +1393,51 @@ class Du(gdb.Command):
         except Exception:
             return
 
+        if not 0 < pargs.confidence < 100:
+            raise gdb.GdbError('--confidence must be between 0 and 100 percent, exclusive')
+        if (pargs.paths or pargs.excludes) and pargs.sample:
+            gdb.write("--sample cannot be combined with --path and --exclude\n")
+            return
+        try:
+            for pattern in pargs.paths + pargs.excludes:
+                parse_path(pattern)
+        except ValueError as e:
+            gdb.write("%s\n" % e)
+            return
+
+        deadline = None
+        if pargs.timeout is not None:
+            deadline = time.monotonic() + pargs.timeout
+
+        self.folded = None
+        if pargs.folded is not None:
+            self.folded = FoldedStacks(pargs.collapse_indices)
+        try:
+            if pargs.globals:
+                self.du_globals(pargs, deadline)
+            elif pargs.all_threads:
+                self.du_threads(pargs, deadline)
+            elif not pargs.expression:
+                gdb.write("Too few arguments\n")
+            elif len(pargs.expression) > 1 and not pargs.sample and not pargs.paths and not pargs.excludes:
+                self.du_joint(pargs, deadline)
+            else:
+                self.du_expressions(pargs, deadline)
+            folded = self.folded
+        finally:
+            self.folded = None
+        # written just when sizing succeeded, write error doesn't hide the result
+        if folded is not None:
+            try:
+                with open(pargs.folded, 'w') as out:
+                    folded.write(out)
+            except OSError as e:
+                gdb.write('!! folded stacks not written: %s\n' % e)
+            else:
+                gdb.write('// folded stacks written to %s\n' % pargs.folded)
+
+    def du_expressions(self, pargs, deadline):
+        """ size every expression independently """
         for expr in pargs.expression:
             try:
                 v = gdb.parse_and_eval(expr)
@@ -325,49 +1445,306 @@ class Du(gdb.Command):
                 raise gdb.GdbError(e)
 
             gdb.write('// sizeof(%s): %d\n' % (expr, v.type.sizeof))
-            size = v.type.sizeof
 
-            du_args = DuArgs
-            du_args.print_level_limit = pargs.print_depth
-            du_args.level_limit = pargs.compute_depth
-            du_args.follow_static = pargs.follow_static
-            size += du_follow(v, 0, du_args, [])
-            gdb.write("size: %s\n" % size)
+            result = self.measure(pargs, deadline, [(expr, v)])
+            self.write_tree(pargs, result.root)
+            if not result.complete:
+                self.write_interrupted(result.reason, result.size, result.pending, result.du_args)
+                return
+            if result.sampled:
+                gdb.write("size: ~%s ± %d (%g%% confidence)\n"
+                          % (result.size, result.error(pargs.confidence), pargs.confidence))
+            else:
+                gdb.write("size: %s\n" % result.size)
+            self.write_summary(result.du_args)
+
+    def options(self, pargs, deadline):
+        """ keyword arguments of make_du_args and measure """
+        return dict(compute_depth=pargs.compute_depth,
+                    follow_static=pargs.follow_static, sample=pargs.sample, seed=pargs.seed,
+                    deadline=deadline, progress=pargs.progress, stats=pargs.stats,
+                    paths=pargs.paths, excludes=pargs.excludes, folded=self.folded)
+
+    def measure(self, pargs, deadline, roots, tree=True, joint=False):
+        """ measure_roots with options of the command, nodes are recorded
+        just for printing (up to print depth) """
+        tree = tree and pargs.print_depth > 0
+        return measure_roots(roots, tree=tree, tree_depth=pargs.print_depth - 1, joint=joint,
+                             **self.options(pargs, deadline))
+
+    @staticmethod
+    def write_tree(pargs, node):
+        if node is not None and pargs.print_depth > 0:
+            write_tree(node, pargs.print_depth - 1)
+
+    @staticmethod
+    def write_interrupted(reason, size, pending, du_args):
+        gdb.write('\n!! %s after %.1f s, result is incomplete\n'
+                  % (reason, time.monotonic() - du_args.start_time))
+        gdb.write('size: >= %s (lower bound), nodes visited: %d, pending: %d\n'
+                  % (size, du_args.nodes, pending))
+        if du_args.stats is not None:
+            du_args.stats.write(gdb, du_args)
+
+    @staticmethod
+    def write_summary(du_args):
+        if du_args.qt_shared_blocks or du_args.qt_unique_blocks:
+            gdb.write("// Qt implicitly shared data: %s bytes in %d blocks, unique: %s bytes in %d blocks\n"
+                      % (du_args.qt_shared_bytes, du_args.qt_shared_blocks,
+                         du_args.qt_unique_bytes, du_args.qt_unique_blocks))
+        if du_args.depth_limited:
+            gdb.write("!! compute depth limit reached, %d values not followed\n" % du_args.depth_limited)
+        if du_args.stats is not None:
+            du_args.stats.write(gdb, du_args)
+
+    def du_joint(self, pargs, deadline):
+        """
+        Size multiple expressions by single traversal, memory reachable
+        from multiple expressions is reported as shared.
+        """
+        values = []
+        for expr in pargs.expression:
+            try:
+                values.append((expr, gdb.parse_and_eval(expr)))
+            except gdb.error as e:
+                raise gdb.GdbError(e)
+
+        result = self.measure(pargs, deadline, values, joint=True)
+        nodes = result.tree.roots() if result.tree is not None else iter(())
+        for (expr, v), size in zip(values, result.roots):
+            gdb.write('// sizeof(%s): %d\n' % (expr, v.type.sizeof))
+            if size is None:
+                gdb.write('// reachable from previous expressions\n')
+            else:
+                self.write_tree(pargs, next(nodes, None))
+        if not result.complete:
+            self.write_interrupted(result.reason, result.size, result.pending, result.du_args)
+            return
+
+        totals, exclusive, shared, total = result.du_args.ownership.sizes()
+        table = Table(['Expression', 'Size', 'Exclusive', 'Shared'])
+        for i, (expr, v) in enumerate(values):
+            table.add_row([expr, fmt_size(totals[i]), fmt_size(exclusive[i]), fmt_size(totals[i] - exclusive[i])])
+        table.write(gdb)
+        gdb.write('shared by multiple expressions: %s, total: %s\n' % (fmt_size(shared), fmt_size(total)))
+        self.write_summary(result.du_args)
+
+    def du_globals(self, pargs, deadline):
+        """
+        Size all global and static variables with one visited set,
+        so data reachable from multiple variables is attributed to the first one.
+        """
+        symbols = []
+
+        def roots():
+            for objfile, objfile_symbols in global_symbols().items():
+                for sym in objfile_symbols:
+                    v = symbol_value(sym)
+                    if v is None or v.address is None:
+                        continue
+                    symbols.append(sym)
+                    yield sym.name, v
+
+        result = self.measure(pargs, deadline, roots(), tree=False)
+        results = [(size, sym) for size, sym in zip(result.roots, symbols) if size is not None]
+        if not result.complete:
+            gdb.write('!! %s after %.1f s, %d variables sized, result is incomplete\n'
+                      % (result.reason, time.monotonic() - result.du_args.start_time, len(results)))
+
+        results.sort(key=lambda r: r[0], reverse=True)
+        table = Table(['Size', 'Variable', 'Type', 'File'])
+        for size, sym in results[:pargs.top]:
+            table.add_row([fmt_size(size), sym.name, str(sym.type), sym.symtab.filename])
+        table.write(gdb)
+        gdb.write('total: %s in %d variables\n' % (fmt_size(result.size), len(results)))
+        self.write_summary(result.du_args)
+
+    def du_threads(self, pargs, deadline):
+        """
+        Size local variables of all threads with one visited set.
+        Every thread is selected just once, all its frames are sized then.
+        """
+        # selected threads, (thread, function name) of their frames
+        # and frame index of every local
+        threads = []
+        frames = []
+        owners = []
+
+        def roots():
+            for thread in sorted(gdb.selected_inferior().threads(), key=lambda t: t.num):
+                if not thread.is_valid() or thread.is_running():
+                    continue
+                thread.switch()
+                threads.append(thread)
+                for frame in iter_frames(pargs.frames):
+                    function = frame_function_name(frame)
+                    frames.append((thread, function))
+                    if self.folded is not None:
+                        # locals are folded under "thread N;function"
+                        thread_frame = self.folded.intern(NO_FRAME, 'thread %d' % thread.num)
+                        self.folded.current = self.folded.intern(thread_frame, function)
+                    for sym, v in iter_frame_locals(frame):
+                        owners.append(len(frames) - 1)
+                        yield sym.name, v
+
+        selected_thread = gdb.selected_thread()
+        selected_frame = gdb.selected_frame() if selected_thread is not None else None
+        try:
+            result = self.measure(pargs, deadline, roots(), tree=False)
+        finally:
+            if self.folded is not None:
+                self.folded.current = NO_FRAME
+            if selected_thread is not None and selected_thread.is_valid():
+                selected_thread.switch()
+                selected_frame.select()
+
+        frame_sizes = [0] * len(frames)
+        for size, frame in zip(result.roots, owners):
+            frame_sizes[frame] += size or 0
+        per_thread = dict((thread.num, [0, 0, thread]) for thread in threads)  # num -> [size, frames, thread]
+        per_function = {}  # name -> [frames, size]
+        for (thread, function), size in zip(frames, frame_sizes):
+            row = per_thread[thread.num]
+            row[0] += size
+            row[1] += 1
+            row = per_function.setdefault(function, [0, 0])
+            row[0] += 1
+            row[1] += size
+        if not result.complete:
+            gdb.write('!! %s after %.1f s, %d threads sized, result is incomplete\n'
+                      % (result.reason, time.monotonic() - result.du_args.start_time, len(per_thread)))
+
+        threads = sorted(per_thread.values(), key=lambda r: r[0], reverse=True)
+        table = Table(['Size', 'Thread', 'LWP', 'Name', 'Frames'])
+        for size, frame_count, thread in threads[:pargs.top]:
+            table.add_row([fmt_size(size), thread.num, thread.ptid[1], thread.name or '', frame_count])
+        table.write(gdb)
+        gdb.write('\n')
+
+        functions = sorted(per_function.items(), key=lambda r: r[1][1], reverse=True)
+        table = Table(['Size', 'Function', 'Frames'])
+        for name, (frame_count, size) in functions[:pargs.top]:
+            table.add_row([fmt_size(size), name, frame_count])
+        table.write(gdb)
+        gdb.write('total: %s in %d threads\n' % (fmt_size(result.size), len(per_thread)))
+        self.write_summary(result.du_args)
+
+
+def eval_address(expr):
+    """ evaluate gdb expression to address, address of non-scalar value is used """
+    v = gdb.parse_and_eval(expr)
+    if is_container(v) or v.type.strip_typedefs().code == gdb.TYPE_CODE_ARRAY:
+        return int(v.address)
+    return int(v)
+
+
+# number of lines written to gdb by single write
+HEXDUMP_LINES_PER_WRITE = 4096
 
 
 class Hexdump(gdb.Command):
-    'Print a hexdump, starting at the specific region of memory'
+    '''Print a hexdump, starting at the specific region of memory.
+    Words are annotated as pointers to heap chunks, symbols or strings.
+    '''
     def __init__(self):
         gdb.Command.__init__ (self,
                               "hexdump",
                               gdb.COMMAND_DATA)
 
     def invoke(self, args, from_tty):
-        print(repr(args))
         arg_list = gdb.string_to_argv(args)
 
-        chars_only = True
+        parser = ErrorCatchingArgumentParser(description='Print a hexdump of memory.')
+        parser.add_argument('-c', '--chars', dest='chars', default=False, action='store_true',
+                            help='print bytes and characters, without annotations')
+        parser.add_argument('address', metavar='addr', type=str,
+                            help='start address (gdb expression)')
+        parser.add_argument('length', metavar='len', type=str, nargs='?', default='256',
+                            help='number of bytes (gdb expression, default: 256)')
+        try:
+            pargs = parser.parse_args(arg_list)
+        except Exception:
+            return
 
-        if len(arg_list) == 2:
-            chars_only = True if args[0] == '-c' else False
-            addr_arg = arg_list[1]
-        else:
-            addr_arg = args
+        try:
+            addr = eval_address(pargs.address)
+            length = int(gdb.parse_and_eval(pargs.length))
+        except gdb.error as e:
+            raise gdb.GdbError(e)
+        if length <= 0:
+            raise gdb.GdbError('usage: hexdump [-c] <addr> [len], len has to be positive, got %d' % length)
+        try:
+            bytebuf = read_memory(addr, length)
+        except gdb.error as e:
+            raise gdb.GdbError(e)
 
-        if addr_arg.startswith('0x'):
-            addr = int(addr_arg, 16)
+        if pargs.chars:
+            lines = iter_hexdump_byte_lines(addr, bytebuf)
         else:
-            addr = int(addr_arg)
+            lines = iter_hexdump_lines(addr, bytebuf)
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) == HEXDUMP_LINES_PER_WRITE:
+                gdb.write('\n'.join(batch) + '\n')
+                batch = []
+        if batch:
+            gdb.write('\n'.join(batch) + '\n')
+
+
+class HeapSummary(gdb.Command):
+    '''Print summary of chunks of the main heap (glibc malloc) by categories:
+    C++ classes (by vtable pointer), string data, uncategorized and free chunks.
+    The heap is found by its [heap] mapping of a running process, core files
+    are not supported.
+    '''
+    def __init__(self):
+        gdb.Command.__init__ (self,
+                              "heap-summary",
+                              gdb.COMMAND_DATA)
 
-        # assume that paging will cut in and the user will quit at some point:
-        size = 32
-        while True:
-            hd = hexdump_as_bytes(addr, size, chars_only=chars_only)
-            print ('%s -> %s %s' % (fmt_addr(addr), fmt_addr(addr + size -1), hd))
-            addr += size
+    def invoke(self, args, from_tty):
+        arg_list = gdb.string_to_argv(args)
+
+        parser = ErrorCatchingArgumentParser(description='Print heap chunks by categories.')
+        parser.add_argument('--top', dest='top', type=int, default=20,
+                            help='number of categories printed (default: 20)')
+        try:
+            pargs = parser.parse_args(arg_list)
+        except Exception:
+            return
+
+        if address_space().heap() is None:
+            raise gdb.GdbError('heap mapping not found (core files are not supported)')
+
+        summary = CategorySummary()
+        complete = True
+        try:
+            for chunk, category in classify_chunks(iter_heap_chunks_with_prefix(PREFIX_SIZE)):
+                summary.add(category, chunk.size)
+        except KeyboardInterrupt:
+            complete = False
+        except gdb.error as e:
+            raise gdb.GdbError(e)
+
+        categories = summary.categories()
+        table = Table(['Domain', 'Kind', 'Detail', 'Count', 'Size'])
+        for category in categories[:pargs.top]:
+            table.add_row([category.domain, category.kind, category.detail or '',
+                           fmt_size(summary.counts[category]), fmt_size(summary.sizes[category])])
+        rest = categories[pargs.top:]
+        if rest:
+            table.add_row(['', '', '(%d other categories)' % len(rest),
+                           fmt_size(sum(summary.counts[c] for c in rest)),
+                           fmt_size(sum(summary.sizes[c] for c in rest))])
+        table.write(gdb)
+        gdb.write('total: %s bytes in %s chunks\n' % (fmt_size(summary.size), fmt_size(summary.count)))
+        if not complete:
+            gdb.write('!! interrupted, summary is incomplete\n')
 
 
 def register_commands():
    Hexdump()
    Du()
+   HeapSummary()
 
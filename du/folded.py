@@ -0,0 +1,87 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Memory aggregated by traversal paths, written in folded stack format
+of flamegraph.pl (and speedscope):
+
+    root;field;[*];member 1024
+"""
+
+from array import array
+
+# parent of root frames
+NO_FRAME = -1
+
+
+class FoldedStacks(object):
+    '''Paths are interned as frames, frame is a pair (parent frame, label),
+    so memory is proportional to number of distinct paths. Every frame
+    holds its own size, size of children is subtracted by add_child.'''
+
+    def __init__(self, collapse_indices=True):
+        self.collapse_indices = collapse_indices
+        # (parent, label) -> frame
+        self.frames = {}
+        self.parents = array('l')
+        self.labels = []
+        self.sizes = array('q')
+        # frame of the currently traversed node
+        self.current = NO_FRAME
+
+    def intern(self, parent, label):
+        key = (parent, label)
+        frame = self.frames.get(key)
+        if frame is None:
+            frame = len(self.labels)
+            self.frames[key] = frame
+            self.parents.append(parent)
+            # ';' separates frames, stack is a single line
+            self.labels.append(label.replace(';', ',').replace('\n', ' '))
+            self.sizes.append(0)
+        return frame
+
+    def child(self, parent, kind, key):
+        '''frame of child node, field (kind 'field', key is its name)
+        or array element ('index', key is its index)'''
+        if kind == 'index':
+            if self.collapse_indices or key is None:
+                return self.intern(parent, '[*]')
+            return self.intern(parent, '[%d]' % key)
+        return self.intern(parent, key)
+
+    def add(self, frame, size):
+        self.sizes[frame] += size
+
+    def add_child(self, parent, frame, size):
+        '''size of child subtree, it is not owned by the parent'''
+        self.sizes[frame] += size
+        if parent != NO_FRAME:
+            self.sizes[parent] -= size
+
+    def stacks(self):
+        '''(path, size) of frames owning some memory'''
+        paths = []
+        for frame, (parent, label) in enumerate(zip(self.parents, self.labels)):
+            # parents are interned before children
+            path = label if parent == NO_FRAME else paths[parent] + ';' + label
+            paths.append(path)
+            if self.sizes[frame] > 0:
+                yield path, self.sizes[frame]
+
+    def write(self, out):
+        for path, size in self.stacks():
+            out.write('%s %d\n' % (path, size))
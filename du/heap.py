@@ -0,0 +1,155 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Walker of glibc malloc chunks in the main heap ([heap] mapping).
+
+Chunks are found by their size fields, without debug info of glibc.
+Chunks of other arenas (threads) and mmap-ed chunks are not walked.
+Segments of core files are not named, heap of a core file is not found.
+Free chunks in tcache and fast bins are marked as used by glibc,
+so they are reported as in use.
+"""
+
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+import du
+from du import unpack_words
+from du.mappings import address_space
+
+try:
+    import gdb
+except ImportError:
+    pass
+
+PREV_INUSE = 0x1
+SIZE_BITS = 0x7
+
+# size of memory read by single read during the walk
+WINDOW_SIZE = 1024 * 1024
+
+
+class Chunk(namedtuple('Chunk', ('start', 'size', 'inuse'))):
+    '''malloc chunk, start is address of the chunk header'''
+
+    @property
+    def mem(self):
+        '''address returned by malloc'''
+        return self.start + 2 * du.sizeof_ptr
+
+    @property
+    def mem_size(self):
+        '''usable size of the allocation'''
+        return self.size - du.sizeof_ptr
+
+
+def iter_chunks(start, end):
+    '''Walk chunks of the heap [start, end), the last one is the top chunk'''
+    for chunk, prefix in iter_chunks_with_prefix(start, end, 0):
+        yield chunk
+
+
+def iter_chunks_with_prefix(start, end, prefix_size):
+    '''Walk chunks like iter_chunks, with first prefix_size bytes of their
+    memory (less for small chunks), read by the same reads as the headers'''
+    inferior = gdb.selected_inferior()
+    header_size = 2 * du.sizeof_ptr
+    # the first chunk is aligned, malloc memory is aligned to 2 * sizeof(size_t)
+    addr = start + (-(start + header_size)) % header_size
+    window_start, window = addr, b''
+    previous = None
+    while addr + header_size <= end:
+        if min(addr + header_size + prefix_size, end) > window_start + len(window):
+            window_start = addr
+            window = inferior.read_memory(addr, min(WINDOW_SIZE, end - addr)).tobytes()
+        offset = addr - window_start + du.sizeof_ptr
+        size_field = unpack_words(window[offset:offset + du.sizeof_ptr])[0]
+        size = size_field & ~SIZE_BITS
+        if size < header_size or addr + size > end:
+            # corrupted heap or end of it
+            break
+        if previous is not None:
+            yield Chunk(previous[0], previous[1], bool(size_field & PREV_INUSE)), previous[2]
+        mem = offset + du.sizeof_ptr
+        previous = (addr, size, window[mem:mem + min(prefix_size, size - header_size)])
+        addr += size
+    if previous is not None:
+        # top chunk
+        yield Chunk(previous[0], previous[1], False), previous[2]
+
+
+def iter_heap_chunks():
+    '''Walk chunks of the main heap of the selected inferior'''
+    heap = address_space().heap()
+    if heap is None:
+        return iter(())
+    return iter_chunks(heap.start, heap.end)
+
+
+def iter_heap_chunks_with_prefix(prefix_size):
+    '''Walk chunks of the main heap with prefixes of their memory'''
+    heap = address_space().heap()
+    if heap is None:
+        return iter(())
+    return iter_chunks_with_prefix(heap.start, heap.end, prefix_size)
+
+
+class HeapIndex(object):
+    '''Sorted table of heap chunks, for lookup of chunk owning an address'''
+    def __init__(self, chunks):
+        self._starts = array('Q')
+        self._sizes = array('Q')
+        self._inuse = bytearray()
+        for chunk in chunks:
+            self._starts.append(chunk.start)
+            self._sizes.append(chunk.size)
+            self._inuse.append(chunk.inuse)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def chunk_containing(self, addr):
+        '''Chunk containing the address, or None'''
+        i = bisect_right(self._starts, addr) - 1
+        if i >= 0 and addr < self._starts[i] + self._sizes[i]:
+            return Chunk(self._starts[i], self._sizes[i], bool(self._inuse[i]))
+        return None
+
+
+__heap_index = None
+
+
+def heap_index():
+    '''HeapIndex of the main heap, cached until the inferior continues'''
+    global __heap_index
+    if __heap_index is None:
+        __heap_index = HeapIndex(iter_heap_chunks())
+    return __heap_index
+
+
+def invalidate(event=None):
+    global __heap_index
+    __heap_index = None
+
+
+try:
+    gdb.events.cont.connect(invalidate)
+    gdb.events.exited.connect(invalidate)
+except NameError:
+    # outside gdb
+    pass
@@ -0,0 +1,173 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Annotated hexdump: pointer sized words are annotated as pointers to heap
+chunks, symbols, or strings.
+"""
+
+import os
+
+import du
+from du import fmt_addr, as_hexdump_char, format_hexdump_bytes, \
+    unpack_words, iter_memory_regions
+from du.mappings import address_space
+from du.heap import heap_index
+
+try:
+    import gdb
+except ImportError:
+    pass
+
+# number of bytes read at pointer target, when looking for a string
+STRING_PEEK = 48
+MIN_STRING_LENGTH = 4
+
+__symbol_cache = {}
+
+
+def symbol_for_address(addr, mapping):
+    '''Symbol (with offset) at the address, or None. Results are cached per address'''
+    try:
+        return __symbol_cache[addr]
+    except KeyError:
+        pass
+    name = None
+    if mapping.executable:
+        try:
+            block = gdb.block_for_pc(addr)
+        except RuntimeError:
+            block = None
+        while block is not None and block.function is None:
+            block = block.superblock
+        if block is not None:
+            name = '%s+%d' % (block.function.print_name, addr - block.start)
+    if name is None:
+        try:
+            info = gdb.execute('info symbol 0x%x' % addr, False, True).strip()
+            if not info.startswith('No symbol'):
+                name = info
+        except gdb.error:
+            pass
+    __symbol_cache[addr] = name
+    return name
+
+
+def invalidate_symbols(event=None):
+    __symbol_cache.clear()
+
+
+def as_string(bytebuf):
+    '''Printable prefix of the bytes, when they look like NUL terminated string'''
+    n = 0
+    for b in bytebuf:
+        if not (0x20 <= b < 0x7f or b in (0x09, 0x0a, 0x0d)):
+            break
+        n += 1
+    if n < MIN_STRING_LENGTH or (n < len(bytebuf) and bytebuf[n] != 0):
+        return None
+    return bytebuf[:n].decode('ascii')
+
+
+def peek_strings(addr, bytebuf, targets):
+    '''Strings at target addresses, targets inside of the dumped memory
+    are taken from its buffer, others are read by regions'''
+    strings = {}
+    outside = []
+    end = addr + len(bytebuf)
+    for target in targets:
+        if addr <= target < end:
+            s = as_string(bytebuf[target - addr:target - addr + STRING_PEEK])
+            if s is not None:
+                strings[target] = s
+        else:
+            outside.append(target)
+    for addresses, start, region in iter_memory_regions(outside, STRING_PEEK):
+        if region is None:
+            continue
+        for target in addresses:
+            s = as_string(region[target - start:target - start + STRING_PEEK])
+            if s is not None:
+                strings[target] = s
+    return strings
+
+
+def annotate_pointer(word, mapping, strings):
+    parts = []
+    if mapping.is_heap:
+        chunk = heap_index().chunk_containing(word)
+        if chunk is not None and chunk.mem <= word:
+            parts.append('heap %s+%d (%d bytes%s)' % (fmt_addr(chunk.mem), word - chunk.mem,
+                                                      chunk.mem_size, '' if chunk.inuse else ', free'))
+        else:
+            parts.append('heap')
+    elif mapping.is_file:
+        parts.append(symbol_for_address(word, mapping) or os.path.basename(mapping.name))
+    else:
+        parts.append(mapping.name or 'anonymous mapping')
+    s = strings.get(word)
+    if s is not None:
+        if len(s) > 32:
+            s = s[:32] + '...'
+        parts.append('"%s"' % s.encode('unicode_escape').decode('ascii'))
+    return ' '.join(parts)
+
+
+def iter_hexdump_lines(addr, bytebuf):
+    '''Yield hexdump lines, one word per line with annotation'''
+    space = address_space()
+    words = unpack_words(bytebuf)
+    if space.mappings:
+        low, high = space.mappings[0].start, space.mappings[-1].end
+    else:
+        low, high = 0, 0
+
+    # resolve mappings of distinct pointer candidates just once
+    pointers = {}
+    for word in set(words):
+        if low <= word < high:
+            mapping = space.find(word)
+            if mapping is not None and mapping.readable:
+                pointers[word] = mapping
+    strings = peek_strings(addr, bytebuf, pointers)
+
+    for i, word in enumerate(words):
+        offset = i * du.sizeof_ptr
+        chars = ''.join([as_hexdump_char(b) for b in bytebuf[offset:offset + du.sizeof_ptr]])
+        line = '%s: %s |%s|' % (fmt_addr(addr + offset), fmt_addr(word), chars)
+        mapping = pointers.get(word)
+        if mapping is not None:
+            line += ' -> ' + annotate_pointer(word, mapping, strings)
+        yield line
+
+    rest = len(words) * du.sizeof_ptr
+    if rest < len(bytebuf):
+        yield '%s: %s' % (fmt_addr(addr + rest), format_hexdump_bytes(bytebuf[rest:], False))
+
+
+def iter_hexdump_byte_lines(addr, bytebuf, width=16):
+    '''Yield classic hexdump lines, bytes and characters'''
+    for offset in range(0, len(bytebuf), width):
+        yield '%s: %s' % (fmt_addr(addr + offset),
+                          format_hexdump_bytes(bytebuf[offset:offset + width], False))
+
+
+try:
+    gdb.events.new_objfile.connect(invalidate_symbols)
+    gdb.events.clear_objfiles.connect(invalidate_symbols)
+except NameError:
+    # outside gdb
+    pass
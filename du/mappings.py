@@ -0,0 +1,208 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Memory mappings of the inferior process, loaded once per stop.
+"""
+
+import re
+from bisect import bisect_right
+from collections import namedtuple
+
+try:
+    import gdb
+except ImportError:
+    pass
+
+
+class Mapping(namedtuple('Mapping', ('start', 'end', 'perms', 'name'))):
+    '''Mapped region [start, end) of the address space, perms are in
+    /proc/pid/maps format (e.g. "r-xp"), or None when unknown'''
+
+    @property
+    def readable(self):
+        return self.perms is None or self.perms.startswith('r')
+
+    @property
+    def writable(self):
+        return self.perms is not None and self.perms[1:2] == 'w'
+
+    @property
+    def executable(self):
+        return self.perms is not None and self.perms[2:3] == 'x'
+
+    @property
+    def is_heap(self):
+        return self.name == '[heap]'
+
+    @property
+    def is_file(self):
+        return self.name.startswith('/')
+
+
+class AddressSpace(object):
+    '''Sorted table of non-overlapping mappings'''
+    def __init__(self, mappings):
+        self.mappings = sorted(mappings)
+        self._starts = [m.start for m in self.mappings]
+
+    def find(self, addr):
+        '''Mapping containing the address, or None'''
+        i = bisect_right(self._starts, addr) - 1
+        if i >= 0 and addr < self.mappings[i].end:
+            return self.mappings[i]
+        return None
+
+    def is_readable(self, addr, size=1):
+        '''Are size bytes at the address mapped readable?'''
+        m = self.find(addr)
+        if m is None or not m.readable:
+            return False
+        if addr + size <= m.end:
+            return True
+        m = self.find(addr + size - 1)
+        return m is not None and m.readable
+
+    def heap(self):
+        '''Mapping of the main heap ([heap]), or None'''
+        for m in self.mappings:
+            if m.is_heap:
+                return m
+        return None
+
+
+_ADDRESS = re.compile(r'^(0x)?[0-9a-fA-F]+(-[0-9a-fA-F]+)?$')
+_PERMS = re.compile(r'^[r-][w-][x-][ps]$')
+
+
+def parse_mappings(text):
+    '''Parse output of /proc/pid/maps or "info proc mappings"'''
+    result = []
+    for line in text.splitlines():
+        tokens = line.split(None, 5)
+        if len(tokens) < 2 or not _ADDRESS.match(tokens[0]):
+            continue
+        try:
+            if '-' in tokens[0]:
+                # /proc/pid/maps: start-end perms offset dev inode name
+                start, end = [int(a, 16) for a in tokens[0].split('-')]
+                perms = tokens[1]
+                name = tokens[5].strip() if len(tokens) > 5 else ''
+            else:
+                # info proc mappings: start end size offset [perms] [objfile]
+                start, end = int(tokens[0], 16), int(tokens[1], 16)
+                rest = line.split(None, 4)[4].strip() if len(tokens) > 4 else ''
+                perms = None
+                if _PERMS.match(rest[:4]) and (len(rest) == 4 or rest[4].isspace()):
+                    perms, rest = rest[:4], rest[4:].strip()
+                name = rest
+        except (ValueError, IndexError):
+            continue
+        result.append(Mapping(start, end, perms, name))
+    return result
+
+
+_SECTION = re.compile(r'(0x[0-9a-fA-F]+)->(0x[0-9a-fA-F]+) at 0x[0-9a-fA-F]+: (\S+)(.*)$')
+
+
+def parse_core_sections(text):
+    '''Segments of the core file from "maint info sections" output,
+    file backed segments not dumped to the core are read from objfiles'''
+    result = []
+    in_core = False
+    for line in text.splitlines():
+        if not line.startswith(' '):
+            in_core = line.startswith('Core file:')
+            continue
+        m = _SECTION.search(line)
+        if not in_core or m is None or not m.group(3).startswith('load'):
+            continue
+        flags = m.group(4).split()
+        if 'ALLOC' not in flags:
+            continue
+        perms = 'r%s%sp' % ('-' if 'READONLY' in flags else 'w', 'x' if 'CODE' in flags else '-')
+        result.append(Mapping(int(m.group(1), 16), int(m.group(2), 16), perms, ''))
+    return result
+
+
+def connection_type(inferior):
+    '''Type of the target connection of the inferior ('native', 'core',
+    'remote', 'extended-remote'...), '' without connection, None when
+    it is not known (gdb < 11)'''
+    if not hasattr(inferior, 'connection'):
+        return None
+    connection = inferior.connection
+    return connection.type if connection is not None else ''
+
+
+def load_mappings():
+    '''Load mappings of the selected inferior. Local /proc is used just
+    for native processes, pid of core files and remote processes is not
+    a pid of local process.'''
+    inferior = gdb.selected_inferior()
+    connection = connection_type(inferior)
+    if connection == '':
+        return []
+    if connection in ('core', None):
+        try:
+            segments = parse_core_sections(gdb.execute('maint info sections', False, True))
+        except gdb.error:
+            segments = []
+        if segments or connection == 'core':
+            return segments
+    pid = inferior.pid
+    if pid and connection == 'native':
+        try:
+            with open('/proc/%d/maps' % pid) as f:
+                return parse_mappings(f.read())
+        except (IOError, OSError):
+            # process of other user
+            pass
+    try:
+        # read from the target, works with gdbserver too
+        return parse_mappings(gdb.execute('info proc mappings', False, True))
+    except gdb.error:
+        return []
+
+
+__address_space = None
+
+
+def address_space():
+    '''AddressSpace of the selected inferior, cached until it runs
+    (continues, calls a function) or objfiles are loaded or cleared'''
+    global __address_space
+    if __address_space is None:
+        __address_space = AddressSpace(load_mappings())
+    return __address_space
+
+
+def invalidate(event=None):
+    global __address_space
+    __address_space = None
+
+
+try:
+    gdb.events.cont.connect(invalidate)
+    gdb.events.exited.connect(invalidate)
+    # dlopen, mmap of files, new inferior (run, attach, core)
+    gdb.events.new_objfile.connect(invalidate)
+    gdb.events.clear_objfiles.connect(invalidate)
+    if hasattr(gdb.events, 'inferior_call'):
+        gdb.events.inferior_call.connect(invalidate)
+except NameError:
+    # outside gdb
+    pass
@@ -0,0 +1,155 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Ownership of memory reachable from multiple roots (expressions).
+
+Traversal is split to units, unit is memory charged by visiting an address
+(pointed value, array element, Qt shared data block) minus memory of nested
+units. Every unit has bitset of roots reaching it. Inferior memory is
+traversed once, when unit is reached by another root later, its bit is
+propagated to the recorded sub-graph of units, without reading the memory again.
+"""
+
+
+class Ownership(object):
+    '''Units of traversed memory with bitsets of roots owning them'''
+
+    def __init__(self):
+        # address -> [roots bitset, own size, child addresses]
+        self.units = {}
+        # frames of traversal: [unit address or None, child addresses, size of child units]
+        self.stack = []
+        self.bit = 0
+        self.roots = 0
+
+    def start_root(self, key):
+        '''start traversal of next root, key is its address (or other unique key),
+        returns False when root is reachable from previous roots,
+        then it should not be followed'''
+        self.bit = 1 << self.roots
+        self.roots += 1
+        if key in self.units:
+            self.propagate(key)
+            return False
+        self.units[key] = [self.bit, 0, ()]
+        self.stack = [[key, [], 0]]
+        return True
+
+    def finish_root(self, size):
+        self.leave(size)
+
+    def visit(self, address):
+        '''mark address as visited by current root, returns False
+        when it was visited already'''
+        frame = self.stack[-1]
+        unit = self.units.get(address)
+        if unit is None:
+            if frame[0] is None:
+                frame[0] = address
+            else:
+                # second visit in the same frame, charge it to the frame unit
+                frame[1].append(address)
+            self.units[address] = [self.bit, 0, ()]
+            return True
+        frame[1].append(address)
+        if not unit[0] & self.bit:
+            self.propagate(address)
+        return False
+
+    def track(self, follow, *args):
+        '''follow(*args) in new frame, it becomes unit when it visits an address'''
+        self.stack.append([None, [], 0])
+        size = follow(*args)
+        self.leave(int(size))
+        return size
+
+    def visit_many(self, addresses):
+        '''mark addresses (array elements sized in bulk) as visited units,
+        children of the current frame, returns set of addresses visited already'''
+        frame = self.stack[-1]
+        units = self.units
+        visited = set()
+        for address in addresses:
+            unit = units.get(address)
+            if unit is None:
+                units[address] = [self.bit, 0, ()]
+            else:
+                visited.add(address)
+                if not unit[0] & self.bit:
+                    self.propagate(address)
+            frame[1].append(address)
+        return visited
+
+    def within(self, address, follow, *args):
+        '''follow(*args) as a part of unit visited by visit_many,
+        its size and nested units are added to the unit'''
+        self.stack.append([address, [], 0])
+        size = int(follow(*args))
+        address, children, children_size = self.stack.pop()
+        unit = self.units[address]
+        unit[1] += size - children_size
+        if children:
+            unit[2] += tuple(children)
+        self.stack[-1][2] += size
+        return size
+
+    def leave(self, size):
+        address, children, children_size = self.stack.pop()
+        if address is not None:
+            unit = self.units[address]
+            unit[1] = size - children_size
+            unit[2] = tuple(children)
+            if self.stack:
+                parent = self.stack[-1]
+                parent[1].append(address)
+                parent[2] += size
+        elif self.stack:
+            parent = self.stack[-1]
+            parent[1].extend(children)
+            parent[2] += children_size
+
+    def propagate(self, address):
+        '''add current root to the unit and all units reachable from it'''
+        bit = self.bit
+        units = self.units
+        pending = [address]
+        while pending:
+            unit = units[pending.pop()]
+            if unit[0] & bit:
+                continue
+            unit[0] |= bit
+            pending.extend(unit[2])
+
+    def sizes(self):
+        '''(per root sizes, per root exclusive sizes, size shared by multiple roots, total size)'''
+        totals = [0] * self.roots
+        exclusive = [0] * self.roots
+        shared = 0
+        total = 0
+        for mask, size, children in self.units.values():
+            total += size
+            if mask & (mask - 1):
+                shared += size
+            else:
+                exclusive[mask.bit_length() - 1] += size
+            i = 0
+            while mask:
+                if mask & 1:
+                    totals[i] += size
+                mask >>= 1
+                i += 1
+        return totals, exclusive, shared, total
@@ -0,0 +1,159 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Path patterns selecting parts of the traversed structure, like
+
+    vec[*].stringMap
+    graph.nodes[*].**.cache
+    g_*.buffer
+
+Path starts with the name of root (expression or variable), followed by
+".field" and "[index]" steps. Field names and indices are glob patterns
+(fnmatch), "**" matches any number of steps. Pointers and base classes are
+transparent, "ptr.field" matches field of the pointed structure.
+Elements of QHash and QMap are nodes with "key" and "value" fields.
+"""
+
+import re
+from fnmatch import fnmatchcase
+
+
+_STEP = re.compile(r'\.?([^.\[\]]+)|\[([^\]]*)\]')
+
+# any number of steps
+ANY = ('**', None)
+
+
+def parse_path(pattern):
+    '''List of steps (kind, glob), kind is 'name' for the root,
+    'field' or 'index'. Raises ValueError for invalid pattern.'''
+    steps = []
+    pos = 0
+    while pos < len(pattern):
+        m = _STEP.match(pattern, pos)
+        if m is None:
+            raise ValueError('invalid path pattern: %s' % pattern)
+        if m.group(1) is not None:
+            name = m.group(1)
+            if name == '**':
+                steps.append(ANY)
+            else:
+                steps.append(('field' if steps else 'name', name))
+        else:
+            steps.append(('index', m.group(2).strip() or '*'))
+        pos = m.end()
+    if not steps:
+        raise ValueError('empty path pattern')
+    return steps
+
+
+class PathFilter(object):
+    '''Matches traversal paths against include and exclude patterns.
+
+    State of the traversal is a tuple (included, excluded), where both items
+    are tuples of positions in included (excluded) patterns, or None when
+    the path matched already. Step returns None for subtrees that cannot
+    match (or are excluded), they are not followed at all.'''
+
+    def __init__(self, includes, excludes=()):
+        self.includes = [parse_path(p) for p in includes]
+        self.excludes = [parse_path(p) for p in excludes]
+        # (state, kind, key) -> state, for field steps
+        self._transitions = {}
+
+    def root(self, name):
+        '''state for the root with given name'''
+        if self.includes:
+            included = self._advance(self.includes, self._start(self.includes), 'name', name)
+        else:
+            included = None
+        excluded = self._advance(self.excludes, self._start(self.excludes), 'name', name)
+        return self._state(included, excluded)
+
+    def step(self, state, kind, key):
+        '''state of the child (kind is 'field' or 'index'), None when it is pruned'''
+        if state[0] is None and state[1] is None:
+            # matched, nothing is excluded below
+            return state
+        if kind == 'index':
+            return self._step(state, kind, str(key))
+        transition = (state, kind, key)
+        result = self._transitions.get(transition, transition)
+        if result is transition:
+            result = self._step(state, kind, key)
+            self._transitions[transition] = result
+        return result
+
+    @staticmethod
+    def matched(state):
+        return state[0] is None
+
+    @staticmethod
+    def settled(state):
+        '''matched and nothing below can be excluded, steps don't change the state'''
+        return state[0] is None and state[1] is None
+
+    def _step(self, state, kind, key):
+        included, excluded = state
+        if included is not None:
+            included = self._advance(self.includes, included, kind, key)
+        if excluded is not None:
+            excluded = self._advance(self.excludes, excluded, kind, key)
+        return self._state(included, excluded)
+
+    def _state(self, included, excluded):
+        if included is not None:
+            if any(len(steps) in positions for steps, positions in zip(self.includes, included)):
+                included = None
+            elif not any(included):
+                return None
+        if excluded is not None:
+            if any(len(steps) in positions for steps, positions in zip(self.excludes, excluded)):
+                return None
+            if not any(excluded):
+                excluded = None
+        return included, excluded
+
+    def _start(self, patterns):
+        return tuple(self._closure(steps, (0,)) for steps in patterns)
+
+    def _advance(self, patterns, state, kind, key):
+        return tuple(self._closure(steps, self._match(steps, positions, kind, key))
+                     for steps, positions in zip(patterns, state))
+
+    @staticmethod
+    def _match(steps, positions, kind, key):
+        result = []
+        for pos in positions:
+            if pos == len(steps):
+                continue
+            step_kind, glob = steps[pos]
+            if step_kind == '**':
+                result.append(pos)
+            elif step_kind == kind and fnmatchcase(key, glob):
+                result.append(pos + 1)
+        return result
+
+    @staticmethod
+    def _closure(steps, positions):
+        result = set()
+        for pos in positions:
+            result.add(pos)
+            while pos < len(steps) and steps[pos] is ANY:
+                pos += 1
+                result.add(pos)
+        return frozenset(result)
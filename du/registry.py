@@ -0,0 +1,145 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Registry of container handlers, used by du to size types with custom
+memory management (std::vector, Qt containers, in-house containers...).
+
+Handler is a function with signature of du.commands.du_follow:
+
+    def du_my_list(s, level, du_args, visited_ptrs):
+        ...
+        return size # allocated by s, sizeof(s) is not included
+
+    register_handler(du_my_list, prefix='my::IntrusiveList<')
+
+Handlers are matched against type name (typedef names are tried before
+names of underlying types). The longest matching prefix wins, regexes are
+tried in registration order when no prefix matches.
+"""
+
+import re
+
+try:
+    import gdb
+    import gdb.types
+except ImportError:
+    pass
+
+
+def template_regex(name, depth=4):
+    '''Regex matching instances of the class template, but not its nested
+    types ("QHash<K, V>", not "QHash<K, V>::iterator"). Template arguments
+    are matched as balanced brackets up to given nesting depth.'''
+    balanced = '[^<>]*'
+    for _ in range(depth):
+        balanced = '[^<>]*(?:<%s>[^<>]*)*' % balanced
+    return r'%s<%s>$' % (re.escape(name), balanced)
+
+
+class HandlerRegistry(object):
+    '''Maps type names to handlers by prefix trie and compiled regexes,
+    result of the lookup is cached per type'''
+
+    # trie node key holding the handler, it cannot collide with a character
+    _HANDLER = ''
+
+    def __init__(self):
+        self._trie = {}
+        # (compiled regex, handler) in registration order
+        self._regexes = []
+        self._cache = {}
+
+    def register(self, handler, prefix=None, regex=None):
+        '''Register handler for types with name starting with prefix,
+        or matching the regex (re.match semantics)'''
+        if (prefix is None) == (regex is None):
+            raise ValueError('exactly one of prefix or regex has to be specified')
+        if prefix is not None:
+            node = self._trie
+            for c in prefix:
+                node = node.setdefault(c, {})
+            node[self._HANDLER] = handler
+        else:
+            # compiled separately, groups and backreferences of the pattern work
+            self._regexes.append((re.compile(regex), handler))
+        self.clear_cache()
+
+    def unregister(self, handler):
+        '''Remove all registrations of the handler'''
+        def prune(node):
+            if node.get(self._HANDLER) is handler:
+                del node[self._HANDLER]
+            for c, child in list(node.items()):
+                if c != self._HANDLER:
+                    prune(child)
+                    if not child:
+                        del node[c]
+        prune(self._trie)
+        self._regexes = [(r, h) for r, h in self._regexes if h is not handler]
+        self.clear_cache()
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def lookup_name(self, name):
+        '''Handler for the type name, or None'''
+        handler = None
+        node = self._trie
+        for c in name:
+            node = node.get(c)
+            if node is None:
+                break
+            handler = node.get(self._HANDLER, handler)
+        if handler is None:
+            for regex, h in self._regexes:
+                if regex.match(name):
+                    return h
+        return handler
+
+    def lookup(self, type):
+        '''Handler for the gdb.Type, or None'''
+        key = type.name
+        if key is None:
+            key = str(type)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        handler = None
+        while handler is None:
+            for name in (type.tag, str(type)):
+                if name is not None:
+                    handler = self.lookup_name(str(name))
+                    if handler is not None:
+                        break
+            if type.code != gdb.TYPE_CODE_TYPEDEF:
+                break
+            type = gdb.types.get_basic_type(type)
+        self._cache[key] = handler
+        return handler
+
+
+handlers = HandlerRegistry()
+
+
+def register_handler(handler, prefix=None, regex=None):
+    '''Register container handler in the default registry, see module documentation'''
+    handlers.register(handler, prefix, regex)
+
+
+def unregister_handler(handler):
+    handlers.unregister(handler)
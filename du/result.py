@@ -0,0 +1,241 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Programmatic interface of du, result of the traversal as a tree:
+
+    import du
+    result = du.measure(gdb.parse_and_eval('vec'), name='vec')
+    print(result.size)
+    for node in result.root.walk():
+        print(node.path, node.type, node.size, node.shallow_size)
+
+Nodes are stored in arrays, in pre-order, Node objects are just views
+created while walking the tree.
+"""
+
+import math
+import statistics
+from array import array
+
+# parent of root nodes
+NO_NODE = -1
+# node deeper than max_depth of the tree, not recorded
+PRUNED_NODE = -2
+
+
+class ResultTree(object):
+    '''Traversed values (fields, elements, pointed values): key, type, address,
+    size and index of the end of subtree, 48 bytes per node (six 8-byte arrays).
+    With max_depth, just nodes up to that depth are recorded (roots are 0).'''
+
+    def __init__(self, max_depth=None):
+        # label index for fields and roots, -(index + 1) for array elements
+        self.keys = array('q')
+        self.types = array('l')
+        self.addresses = array('Q')
+        # size including sizeof
+        self.sizes = array('q')
+        # index after the last node of the subtree, -1 while it is traversed
+        self.ends = array('l')
+        self.parents = array('l')
+        self.labels = []
+        self.label_ids = {}
+        self.type_names = []
+        self.type_ids = {}
+        self.current = NO_NODE
+        # nodes are not recorded while > 0 (array elements sized in bulk)
+        self.suspended = 0
+        self.max_depth = max_depth
+        # depth of the next node
+        self.depth = 0
+
+    def _intern(self, table, ids, s):
+        i = ids.get(s)
+        if i is None:
+            i = len(table)
+            ids[s] = i
+            table.append(s)
+        return i
+
+    def enter(self, kind, key, type, address):
+        '''start node of field or root (key is the name) or of array element
+        (kind is 'index', key is the index, None for all elements)'''
+        if self.suspended:
+            return NO_NODE
+        if self.max_depth is not None and self.depth > self.max_depth:
+            self.depth += 1
+            return PRUNED_NODE
+        self.depth += 1
+        node = len(self.sizes)
+        if kind == 'index':
+            if key is None:
+                self.keys.append(self._intern(self.labels, self.label_ids, '[*]'))
+            else:
+                self.keys.append(-(key + 1))
+        else:
+            self.keys.append(self._intern(self.labels, self.label_ids, key))
+        type_name = type.name or str(type)
+        self.types.append(self._intern(self.type_names, self.type_ids, type_name))
+        self.addresses.append(int(address) if address is not None else 0)
+        self.sizes.append(0)
+        self.ends.append(-1)
+        self.parents.append(self.current)
+        self.current = node
+        return node
+
+    def leave(self, node, size):
+        if node == NO_NODE:
+            return
+        self.depth -= 1
+        if node == PRUNED_NODE:
+            return
+        self.sizes[node] = int(size)
+        self.ends[node] = len(self.sizes)
+        self.current = self.parents[node]
+
+    def close(self):
+        '''finish nodes left open by interrupted traversal, their size
+        is the size of finished children'''
+        while self.current != NO_NODE:
+            node = self.current
+            self.ends[node] = len(self.sizes)
+            self.leave(node, sum(child.size for child in Node(self, node).children()))
+        self.depth = 0
+
+    def roots(self):
+        node = 0
+        while node < len(self.sizes):
+            yield Node(self, node)
+            node = self.ends[node]
+
+    def __len__(self):
+        return len(self.sizes)
+
+
+class Node(object):
+    '''View of a node of ResultTree'''
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def name(self):
+        key = self.tree.keys[self.index]
+        if key < 0:
+            return '[%d]' % (-key - 1)
+        return self.tree.labels[key]
+
+    @property
+    def type(self):
+        '''name of the type'''
+        return self.tree.type_names[self.tree.types[self.index]]
+
+    @property
+    def address(self):
+        '''address of the value, None when it is not in memory'''
+        return self.tree.addresses[self.index] or None
+
+    @property
+    def size(self):
+        '''size of the value, including its sizeof'''
+        return self.tree.sizes[self.index]
+
+    @property
+    def shallow_size(self):
+        '''size of the value without sizes of child nodes'''
+        return self.size - sum(child.size for child in self.children())
+
+    @property
+    def parent(self):
+        parent = self.tree.parents[self.index]
+        if parent == NO_NODE:
+            return None
+        return Node(self.tree, parent)
+
+    @property
+    def path(self):
+        names = []
+        node = self
+        while node is not None:
+            name = node.name
+            names.append(name if name.startswith('[') or node.parent is None else '.' + name)
+            node = node.parent
+        return ''.join(reversed(names))
+
+    def children(self):
+        ends = self.tree.ends
+        child = self.index + 1
+        end = ends[self.index]
+        while child < end:
+            yield Node(self.tree, child)
+            child = ends[child]
+
+    def walk(self, max_depth=None):
+        '''nodes of the subtree in pre-order'''
+        stack = [(self.index, 0)]
+        ends = self.tree.ends
+        while stack:
+            index, depth = stack.pop()
+            yield Node(self.tree, index)
+            if max_depth is not None and depth >= max_depth:
+                continue
+            children = []
+            child = index + 1
+            while child < ends[index]:
+                children.append((child, depth + 1))
+                child = ends[child]
+            stack.extend(reversed(children))
+
+    def __repr__(self):
+        return '<Node %s: %s, size %d>' % (self.path, self.type, self.size)
+
+
+class DuResult(object):
+    '''Result of du.measure, size is lower bound when traversal is not complete'''
+    __slots__ = ('size', 'tree', 'complete', 'reason', 'pending', 'du_args', 'roots')
+
+    def __init__(self, size, tree, du_args):
+        self.size = size
+        self.tree = tree
+        self.du_args = du_args
+        # size of every measured root, None for roots reached from previous ones
+        self.roots = []
+        # interrupted traversal, size is the lower bound
+        self.complete = True
+        self.reason = None
+        self.pending = 0
+
+    @property
+    def root(self):
+        if self.tree is None or not len(self.tree):
+            return None
+        return Node(self.tree, 0)
+
+    @property
+    def sampled(self):
+        '''size is extrapolated from sampled array elements'''
+        return self.du_args.sampled
+
+    def error(self, confidence=95):
+        '''half width of confidence interval of sampled size,
+        confidence is in percent (0 < confidence < 100)'''
+        if not 0 < confidence < 100:
+            raise ValueError('confidence must be between 0 and 100: %s' % confidence)
+        z = statistics.NormalDist().inv_cdf(0.5 + confidence / 200)
+        return z * math.sqrt(self.du_args.sample_variance)
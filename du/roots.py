@@ -0,0 +1,266 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Roots of the object graph: global and static variables.
+"""
+
+import re
+
+try:
+    import gdb
+except ImportError:
+    pass
+
+
+def iter_source_files(text, objfiles=()):
+    '''Yield (objfile, source file) from output of "info sources", lines of file
+    names are separated by headers of objfiles (gdb >= 10), objfile is None
+    for headers of read/unread files (gdb < 10)'''
+    objfile = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.endswith(':'):
+            objfile = line[:-1] if line[:-1] in objfiles else None
+            continue
+        if not line or line.startswith('('):
+            continue
+        for filename in line.split(', '):
+            yield objfile, filename
+
+
+def iter_source_symtabs(filename):
+    '''Symtabs of the source file in all objfiles, nothing for files
+    without line table (just data)'''
+    try:
+        sals = gdb.decode_line('%s:1' % filename)[1]
+    except (gdb.error, RuntimeError):
+        return
+    for sal in sals or ():
+        if sal.symtab is not None and sal.symtab.is_valid():
+            yield sal.symtab
+
+
+def iter_block_variables(symtab):
+    '''Variables of global and static block of the compilation unit of the symtab'''
+    for block in (symtab.global_block(), symtab.static_block()):
+        for sym in block:
+            if sym.is_variable and sym.addr_class != gdb.SYMBOL_LOC_OPTIMIZED_OUT:
+                yield sym
+
+
+_FILE_HEADER = re.compile(r'^File (.*):$')
+# "12:	static int counter;", line number is printed by gdb >= 8.3
+_DECLARATION = re.compile(r'^(?:\d+:\s+)?(.*);$')
+_FUNCTION_POINTER = re.compile(r'\(\*+\s*([\w:]+)\)')
+_ARRAY_SUFFIX = re.compile(r'(\[[^\]]*\])+$')
+
+
+def iter_declarations(text):
+    '''Yield (source file, [declarations]) from output of "info variables",
+    non-debugging symbols are skipped'''
+    filename = None
+    declarations = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('Non-debugging symbols:'):
+            break
+        m = _FILE_HEADER.match(line)
+        if m:
+            if declarations:
+                yield filename, declarations
+            filename, declarations = m.group(1), []
+            continue
+        m = _DECLARATION.match(line)
+        if m and filename is not None:
+            declarations.append(m.group(1))
+    if declarations:
+        yield filename, declarations
+
+
+def declaration_name(declaration):
+    '''Name of the variable from its C/C++ declaration'''
+    m = _FUNCTION_POINTER.search(declaration)
+    if m:
+        return m.group(1)
+    tokens = _ARRAY_SUFFIX.sub('', declaration.strip()).split()
+    if not tokens:
+        return None
+    return tokens[-1].lstrip('*&') or None
+
+
+def lookup_file_variable(name, filename):
+    '''Symbol of global or static variable declared in the file, or None'''
+    try:
+        if hasattr(gdb, 'lookup_static_symbols'):
+            candidates = list(gdb.lookup_static_symbols(name))
+        else:
+            candidates = [gdb.lookup_static_symbol(name)] if hasattr(gdb, 'lookup_static_symbol') else []
+        candidates.append(gdb.lookup_global_symbol(name))
+    except (gdb.error, RuntimeError):
+        # invalid name
+        return None
+    for sym in candidates:
+        if sym is not None and sym.symtab is not None and sym.symtab.filename == filename:
+            return sym
+    return None
+
+
+def list_variables():
+    '''Output of "info variables", without non-debugging symbols when possible'''
+    try:
+        return gdb.execute('info variables -n', False, True)
+    except gdb.error:
+        # gdb < 9 doesn't support -n
+        return gdb.execute('info variables', False, True)
+
+
+# objfile filename -> [gdb.Symbol], variables of scanned objfiles
+__variables = {}
+
+
+def scan_objfiles(filenames):
+    '''Collect variables of given objfiles from blocks of their compilation units.
+    Blocks are found by symtabs of source files (by linespec), compilation
+    units without line table (just data) by symbol of a variable they declare.'''
+    seen = set()
+    # files of declarations of collected variables and of found symtabs
+    covered = set()
+    for objfile in filenames:
+        __variables[objfile] = []
+
+    def add_variables(symtab):
+        for sym in iter_block_variables(symtab):
+            key = (symtab.objfile.filename, sym.symtab.filename, sym.name)
+            if key not in seen:
+                seen.add(key)
+                covered.add(sym.symtab.filename)
+                __variables[symtab.objfile.filename].append(sym)
+
+    known = set(o.filename for o in gdb.objfiles())
+    rejected = False
+    for objfile, source in iter_source_files(gdb.execute('info sources', False, True), known):
+        if objfile is not None and objfile not in filenames:
+            continue
+        found = False
+        for symtab in iter_source_symtabs(source):
+            found = True
+            covered.add(symtab.filename)
+            if symtab.objfile.filename in filenames:
+                add_variables(symtab)
+        rejected = rejected or not found
+
+    if not rejected:
+        return
+    # one variable of the file is enough to find blocks of its compilation unit
+    for filename, declarations in iter_declarations(list_variables()):
+        if filename in covered:
+            continue
+        for declaration in declarations:
+            name = declaration_name(declaration)
+            sym = lookup_file_variable(name, filename) if name is not None else None
+            if sym is not None:
+                covered.add(filename)
+                if sym.symtab.objfile.filename in filenames:
+                    add_variables(sym.symtab)
+                break
+
+
+def global_symbols():
+    '''Symbols of global and static variables of all objfiles, grouped by objfile.
+    Variables are cached per objfile, when new objfile is loaded, just its
+    compilation units are scanned.'''
+    pending = set(o.filename for o in gdb.objfiles()
+                  if o.is_valid() and o.filename not in __variables)
+    if pending:
+        scan_objfiles(pending)
+    return dict((objfile, [sym for sym in symbols if sym.is_valid()])
+                for objfile, symbols in __variables.items() if symbols)
+
+
+def symbol_value(sym):
+    '''Value of the variable symbol, or None when it cannot be read'''
+    try:
+        if sym.needs_frame:
+            # thread local variables
+            return sym.value(gdb.selected_frame())
+        return sym.value()
+    except (gdb.error, RuntimeError):
+        return None
+
+
+def on_new_objfile(event):
+    # objfile may be reloaded with the same name
+    __variables.pop(event.new_objfile.filename, None)
+
+
+def on_clear_objfiles(event=None):
+    __variables.clear()
+
+
+try:
+    gdb.events.new_objfile.connect(on_new_objfile)
+    gdb.events.clear_objfiles.connect(on_clear_objfiles)
+except NameError:
+    # outside gdb
+    pass
+
+
+def iter_frames(limit=None):
+    '''Frames of the selected thread, from the newest one'''
+    frame = gdb.newest_frame()
+    count = 0
+    while frame is not None and (limit is None or count < limit):
+        yield frame
+        count += 1
+        try:
+            frame = frame.older()
+        except gdb.error:
+            # corrupted stack
+            break
+
+
+def iter_frame_locals(frame):
+    '''(symbol, value) of local variables and arguments visible in the frame,
+    static locals are skipped, they are not part of the stack'''
+    try:
+        block = frame.block()
+    except RuntimeError:
+        # no debug info
+        return
+    while block is not None:
+        for sym in block:
+            if not (sym.is_variable or sym.is_argument):
+                continue
+            if sym.addr_class == gdb.SYMBOL_LOC_STATIC:
+                continue
+            try:
+                value = sym.value(frame)
+            except (gdb.error, RuntimeError):
+                continue
+            if value.is_optimized_out:
+                continue
+            yield sym, value
+        if block.function is not None:
+            break
+        block = block.superblock
+
+
+def frame_function_name(frame):
+    function = frame.function()
+    if function is not None:
+        return function.print_name
+    return frame.name() or '??'
@@ -0,0 +1,76 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import time
+from collections import defaultdict
+
+from du import Table, fmt_size, type_cache_stats
+
+
+class DuStats(object):
+    '''Instrumentation of du traversal, enabled by "du --stats".
+
+    Counters of visited nodes, dereferences etc. are maintained by DuArgs
+    all the time, this object adds wall time per handler and prints the report.
+    Handler time is "self" time, time spent in nested handlers is excluded.
+    '''
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.self_time = defaultdict(float)
+        self._child_time = 0.0
+        self._start = time.perf_counter()
+        self._type_cache = dict(type_cache_stats)
+
+    def call(self, name, handler, *args):
+        start = time.perf_counter()
+        outer_child_time = self._child_time
+        self._child_time = 0.0
+        try:
+            return handler(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.calls[name] += 1
+            self.self_time[name] += elapsed - self._child_time
+            self._child_time = outer_child_time + elapsed
+
+    def write(self, out, du_args):
+        wall_time = time.perf_counter() - self._start
+
+        table = Table(['Handler', 'Calls', 'Self time (s)', 'Time %'])
+        for name in sorted(self.self_time, key=self.self_time.get, reverse=True):
+            t = self.self_time[name]
+            table.add_row([name, fmt_size(self.calls[name]), '%.3f' % t,
+                           '%.1f' % (100.0 * t / wall_time if wall_time > 0 else 0)])
+        table.write(out)
+        out.write('\n')
+
+        hits = type_cache_stats['hits'] - self._type_cache['hits']
+        misses = type_cache_stats['misses'] - self._type_cache['misses']
+        lookups = hits + misses
+
+        table = Table(['Counter', 'Value'])
+        table.add_row(['wall time (s)', '%.3f' % wall_time])
+        table.add_row(['nodes visited', fmt_size(du_args.nodes)])
+        table.add_row(['nodes/s', fmt_size(int(du_args.nodes / wall_time) if wall_time > 0 else 0)])
+        table.add_row(['gdb.Value dereferences', fmt_size(du_args.derefs)])
+        table.add_row(['fetch_lazy calls', fmt_size(du_args.fetches)])
+        table.add_row(['bytes read', fmt_size(du_args.bytes_read)])
+        table.add_row(['visited hits', fmt_size(du_args.visited_hits)])
+        table.add_row(['invalid pointers', fmt_size(du_args.invalid_ptrs)])
+        table.add_row(['visited hit rate', '%.1f %%' % (100.0 * du_args.visited_hits / du_args.visits if du_args.visits else 0)])
+        table.add_row(['type cache lookups', fmt_size(lookups)])
+        table.add_row(['type cache hit rate', '%.1f %%' % (100.0 * hits / lookups if lookups else 0)])
+        table.write(out)
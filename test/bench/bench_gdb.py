@@ -0,0 +1,76 @@
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+gdb side of the benchmark harness, it is sourced by run_bench.py when the
+benchmark program is stopped in main, after it called bench_ready().
+Result is printed as json on a line prefixed by "BENCH_RESULT ".
+Expression is sized by du.commands.measure, like "du -p 0".
+"""
+
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+import gdb
+import du.commands
+
+
+def measure(expr, trace_memory):
+    v = gdb.parse_and_eval(expr)
+    compute_depth = int(os.environ.get('BENCH_COMPUTE_DEPTH', '1024'))
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = du.commands.measure(v, expr, tree=False, compute_depth=compute_depth, progress=False)
+    wall_time = time.perf_counter() - start
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, wall_time, peak_memory
+
+
+def main():
+    expr = os.environ.get('BENCH_EXPR', 'root')
+    measured, wall_time, _ = measure(expr, False)
+    du_args = measured.du_args
+    result = {
+        'size': measured.size,
+        # incomplete result (recursion limit) is not a valid benchmark
+        'complete': measured.complete,
+        'reason': measured.reason,
+        # values not followed because of compute depth, long lists are cut
+        'depth_limited': du_args.depth_limited,
+        'wall_time': wall_time,
+        'nodes': du_args.nodes,
+        'nodes_per_sec': du_args.nodes / wall_time if wall_time > 0 else None,
+        'bytes_read': du_args.bytes_read,
+        'derefs': du_args.derefs,
+        'fetches': du_args.fetches,
+        'visited_hits': du_args.visited_hits,
+        'peak_memory': None,
+    }
+    if os.environ.get('BENCH_MEMORY', '1') == '1':
+        # separate run, tracemalloc slows down allocations considerably
+        _, _, result['peak_memory'] = measure(expr, True)
+    gdb.write('BENCH_RESULT %s\n' % json.dumps(result))
+
+
+main()
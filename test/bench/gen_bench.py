@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Generator of benchmark programs for gdb-du. Every program builds one big
+structure in variable "root" of main function and calls bench_ready(),
+where the benchmark harness (run_bench.py) stops it and measures "du root".
+"""
+
+import argparse
+import os
+
+HEADER = """// generated by gen_bench.py, do not edit
+#include <cstdlib>
+#include <cstdint>
+#include <atomic>
+#include <string>
+#include <vector>
+#include <list>
+#include <map>
+#include <unordered_map>
+
+__attribute__((noinline)) void bench_ready(const void *root) {
+  asm volatile("" : : "r"(root) : "memory");
+}
+
+// deterministic pseudo-random numbers, results are comparable between runs
+static uint64_t lcg_state = 42;
+inline uint64_t lcg() {
+  lcg_state = lcg_state * 6364136223846793005ULL + 1442695040888963407ULL;
+  return lcg_state >> 33;
+}
+"""
+
+# name -> (default element count, program body), %(n)d is replaced by element count
+BENCHMARKS = {
+    'vector_pod': (1000000, """
+int main() {
+  std::vector<long> root;
+  for (long i = 0; i < %(n)d; i++) {
+    root.push_back(i);
+  }
+  bench_ready(&root);
+  return 0;
+}
+"""),
+
+    'vector_struct': (200000, """
+struct Item {
+  long id;
+  std::string name;
+  Item *next = nullptr;
+};
+
+int main() {
+  std::vector<Item> root(%(n)d);
+  for (size_t i = 0; i < root.size(); i++) {
+    root[i].id = i;
+    root[i].name = i %% 2 == 0 ? "short" : "some text that cannot be stored locally";
+    if (i > 0) {
+      root[i].next = &root[i - 1];
+    }
+  }
+  bench_ready(&root);
+  return 0;
+}
+"""),
+
+    'deep_map': (100000, """
+int main() {
+  std::map<int, std::map<int, std::string>> root;
+  for (int i = 0; i < %(n)d; i++) {
+    root[i / 100][i %% 100] = "value that cannot be stored locally";
+  }
+  bench_ready(&root);
+  return 0;
+}
+"""),
+
+    'long_list': (200000, """
+int main() {
+  std::list<long> root;
+  for (long i = 0; i < %(n)d; i++) {
+    root.push_back(i);
+  }
+  bench_ready(&root);
+  return 0;
+}
+"""),
+
+    'unordered_map': (100000, """
+int main() {
+  std::unordered_map<long, std::string> root;
+  for (long i = 0; i < %(n)d; i++) {
+    root[i] = "value that cannot be stored locally";
+  }
+  bench_ready(&root);
+  return 0;
+}
+"""),
+
+    'shared_graph': (50000, """
+struct Node {
+  long payload[4];
+  std::vector<Node*> edges;
+};
+
+int main() {
+  std::vector<Node*> root;
+  for (int i = 0; i < %(n)d; i++) {
+    root.push_back(new Node());
+  }
+  for (Node *node : root) {
+    for (int e = 0; e < 4; e++) {
+      node->edges.push_back(root[lcg() %% root.size()]);
+    }
+  }
+  bench_ready(&root);
+  return 0;
+}
+"""),
+
+    # Qt-free program with Qt5 QArrayData memory layout,
+    # implicitly shared payloads are referenced by multiple vectors
+    'qt_like': (20000, """
+struct QArrayData {
+  int ref;
+  int size;
+  unsigned int alloc : 31;
+  unsigned int capacityReserved : 1;
+  std::ptrdiff_t offset;
+};
+
+template <class T>
+struct QTypedArrayData : QArrayData {
+};
+
+template <class T>
+struct QVector {
+  QTypedArrayData<T> *d;
+};
+
+template <class T>
+QTypedArrayData<T> *allocate(int size) {
+  auto d = static_cast<QTypedArrayData<T>*>(malloc(sizeof(QArrayData) + size * sizeof(T)));
+  d->ref = 1;
+  d->size = size;
+  d->alloc = size;
+  d->capacityReserved = 0;
+  d->offset = sizeof(QArrayData);
+  return d;
+}
+
+int main() {
+  std::vector<QVector<int>> root(%(n)d);
+  for (size_t i = 0; i < root.size(); i++) {
+    if (i %% 2 == 1) {
+      // implicitly shared copy
+      root[i].d = root[i - 1].d;
+      root[i].d->ref++;
+    } else {
+      root[i].d = allocate<int>(16 + lcg() %% 64);
+    }
+  }
+  bench_ready(&root);
+  return 0;
+}
+"""),
+
+    # like qt_like, with Qt >= 5.7 reference counter (std::atomic<int>,
+    # static members declared before the value) and static shared null
+    'qt_atomic': (20000, """
+struct QBasicAtomicInt {
+  std::atomic<int> _q_value;
+};
+
+namespace QtPrivate {
+struct RefCount {
+  QBasicAtomicInt atomic;
+};
+}
+
+struct QArrayData {
+  QtPrivate::RefCount ref;
+  int size;
+  unsigned int alloc : 31;
+  unsigned int capacityReserved : 1;
+  std::ptrdiff_t offset;
+};
+
+template <class T>
+struct QTypedArrayData : QArrayData {
+};
+
+template <class T>
+struct QVector {
+  QTypedArrayData<T> *d;
+};
+
+static QArrayData shared_null = {{{-1}}, 0, 0, 0, sizeof(QArrayData)};
+
+template <class T>
+QTypedArrayData<T> *allocate(int size) {
+  auto d = static_cast<QTypedArrayData<T>*>(malloc(sizeof(QArrayData) + size * sizeof(T)));
+  d->ref.atomic._q_value = 1;
+  d->size = size;
+  d->alloc = size;
+  d->capacityReserved = 0;
+  d->offset = sizeof(QArrayData);
+  return d;
+}
+
+int main() {
+  std::vector<QVector<int>> root(%(n)d);
+  for (size_t i = 0; i < root.size(); i++) {
+    if (i %% 3 == 2) {
+      // empty vector, static data is not charged
+      root[i].d = static_cast<QTypedArrayData<int>*>(&shared_null);
+    } else if (i %% 3 == 1) {
+      // implicitly shared copy
+      root[i].d = root[i - 1].d;
+      root[i].d->ref.atomic._q_value++;
+    } else {
+      root[i].d = allocate<int>(16 + lcg() %% 64);
+    }
+  }
+  bench_ready(&root);
+  return 0;
+}
+"""),
+}
+
+
+def generate(name, directory, scale=1.0):
+    '''Write source of benchmark program, return its path'''
+    count, body = BENCHMARKS[name]
+    path = os.path.join(directory, '%s.cpp' % name)
+    with open(path, 'w') as f:
+        f.write(HEADER)
+        f.write(body % {'n': max(1, int(count * scale))})
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate gdb-du benchmark programs.')
+    parser.add_argument('-o', '--output', dest='output', default='.',
+                        help='output directory (default: current directory)')
+    parser.add_argument('-s', '--scale', dest='scale', type=float, default=1.0,
+                        help='multiply number of elements (default: 1.0)')
+    parser.add_argument('benchmark', nargs='*',
+                        help='benchmarks to generate: %s (default: all)' % ', '.join(sorted(BENCHMARKS)))
+    args = parser.parse_args()
+    for name in args.benchmark:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: %s' % name)
+    os.makedirs(args.output, exist_ok=True)
+    for name in args.benchmark or sorted(BENCHMARKS):
+        print(generate(name, args.output, args.scale))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021  Lukas Karas
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""
+Benchmark harness: generates and builds benchmark programs (gen_bench.py),
+runs them in "gdb -batch" through run-gdb-du and records du wall time,
+peak python memory and nodes/s as json.
+
+Typical usage:
+  ./test/bench/run_bench.py -o results.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import gen_bench
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(os.path.dirname(BENCH_DIR))
+CXX_FLAGS = ['-std=c++17', '-pedantic', '-Wall', '-Wextra', '-Werror', '-g', '-O0']
+
+
+def build(name, build_dir, scale):
+    source = gen_bench.generate(name, build_dir, scale)
+    binary = os.path.splitext(source)[0]
+    subprocess.check_call([os.environ.get('CXX', 'g++')] + CXX_FLAGS + ['-o', binary, source])
+    return binary
+
+
+def run(binary, memory, compute_depth):
+    env = dict(os.environ)
+    env['BENCH_MEMORY'] = '1' if memory else '0'
+    env['BENCH_COMPUTE_DEPTH'] = str(compute_depth)
+    # run-gdb-du is executed in the root directory, see bench.gdb
+    env['GDB_DU_FLAGS'] = '-batch -nx -x %s' % os.path.join(BENCH_DIR, 'bench.gdb')
+    output = subprocess.run([os.path.join(ROOT_DIR, 'run-gdb-du'), binary],
+                            cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout
+    for line in output.splitlines():
+        if line.startswith('BENCH_RESULT '):
+            result = json.loads(line[len('BENCH_RESULT '):])
+            if not result['complete']:
+                raise RuntimeError('incomplete result of %s: %s' % (binary, result['reason']))
+            return result
+    raise RuntimeError('no result from %s:\n%s' % (binary, output))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=ROOT_DIR, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run gdb-du benchmarks.')
+    parser.add_argument('-o', '--output', dest='output', default=None,
+                        help='write json results to file (default: stdout)')
+    parser.add_argument('-s', '--scale', dest='scale', type=float, default=1.0,
+                        help='multiply number of elements (default: 1.0)')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=1,
+                        help='number of runs, the fastest is recorded (default: 1)')
+    parser.add_argument('-c', '--compute-depth', dest='compute_depth', type=int, default=1024,
+                        help='compute depth of du, long lists are cut by it (default: 1024)')
+    parser.add_argument('--no-memory', dest='memory', default=True, action='store_false',
+                        help='do not measure peak python memory')
+    parser.add_argument('--build-dir', dest='build_dir', default=os.path.join(BENCH_DIR, 'build'),
+                        help='directory for generated programs')
+    parser.add_argument('benchmark', nargs='*',
+                        help='benchmarks to run: %s (default: all)' % ', '.join(sorted(gen_bench.BENCHMARKS)))
+    args = parser.parse_args()
+    for name in args.benchmark:
+        if name not in gen_bench.BENCHMARKS:
+            parser.error('unknown benchmark: %s' % name)
+    os.makedirs(args.build_dir, exist_ok=True)
+
+    results = []
+    for name in args.benchmark or sorted(gen_bench.BENCHMARKS):
+        binary = build(name, args.build_dir, args.scale)
+        best = None
+        for i in range(args.repeat):
+            result = run(binary, args.memory and i == 0, args.compute_depth)
+            if best is None or result['wall_time'] < best['wall_time']:
+                if best is not None:
+                    result['peak_memory'] = best['peak_memory']
+                best = result
+        best['name'] = name
+        results.append(best)
+        sys.stderr.write('%-16s %10.3f s %12s nodes/s%s\n'
+                         % (name, best['wall_time'], '%d' % (best['nodes_per_sec'] or 0),
+                            ', depth limited' if best['depth_limited'] else ''))
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scale': args.scale,
+        'compute_depth': args.compute_depth,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()